@@ -11,19 +11,29 @@ from PIL import Image
 from bs4 import BeautifulSoup
 import warnings
 warnings.filterwarnings('ignore')
-from urllib.parse import quote, unquote
+from urllib.parse import unquote, urlparse
 from google.cloud import vision, translate_v2 as translate
 from google.oauth2 import service_account
 from google import genai
+from google.api_core import exceptions as google_exceptions
 from time import sleep
 from functools import wraps
 from datetime import datetime
 import hashlib
+import glob
 import tempfile
 import json
 import time
 import random
+import shutil
+import subprocess
 import logging
+import threading
+import queue
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from openpyxl import Workbook
 from flask import Flask
 
@@ -39,6 +49,16 @@ logger = logging.getLogger(__name__)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 USER_CONFIG_PATH = os.path.expanduser('~/pywikibot/user-config.py')
 PASSWORD_FILE_PATH = os.path.expanduser('~/pywikibot/user-password.py')
+OUTPUT_DIR = os.path.expanduser('~/output')
+SCRAPE_CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, 'scrape_checkpoint.json')
+PID_INDEX_FILE = os.path.join(OUTPUT_DIR, 'pid_date_index.sqlite3')
+LLM_CACHE_FILE = os.path.join(OUTPUT_DIR, 'llm_cache.sqlite3')
+WAYBACK_CACHE_FILE = os.path.join(OUTPUT_DIR, 'wayback_cache.sqlite3')
+PHOTO_INDEX_FILE = os.path.join(OUTPUT_DIR, 'photo_hashes.sqlite3')
+# Image URLs, one per line, that are uploaded even if they match a known photo
+DUPLICATE_OVERRIDES_FILE = os.path.join(OUTPUT_DIR, 'duplicate_overrides.txt')
+PID_PENDING_FILE = os.path.join(OUTPUT_DIR, 'piddatedata_pending.sqlite3')
+TITLE_CACHE_FILE = os.path.join(OUTPUT_DIR, 'commons_titles.sqlite3')
 
 # Constants
 VERTEX_LOCATION = "us-central1"
@@ -49,9 +69,95 @@ INITIAL_BACKOFF = 1.0
 BACKOFF_MULTIPLIER = 2.0
 MAX_BACKOFF = 60.0
 
+# Adaptive API rate limits in requests/second: (initial, minimum, maximum)
+RATE_LIMITS = {
+    'gemini': (1.0, 0.1, 10.0),
+    'translate': (5.0, 0.5, 20.0),
+    'vision': (5.0, 0.5, 20.0),
+}
+RATE_LIMIT_INCREASE = 0.05     # Added to the rate after each successful request
+RATE_LIMIT_DECREASE = 0.5      # Rate multiplier after a 429/RESOURCE_EXHAUSTED response
+
+# Connectivity circuit breaker
+CONNECTIVITY_FAILURE_THRESHOLD = 3   # Consecutive transport errors before network calls are paused
+CONNECTIVITY_PROBE_INTERVAL = 5.0    # First delay between background probes while offline
+CONNECTIVITY_MAX_PROBE_INTERVAL = 120.0
+CONNECTIVITY_MAX_WAIT = 1800.0       # Seconds a caller waits for the connection to return before giving up
+# Offline waits of all callers end this many seconds after start, so the rest of run_bot.sh's
+# 3300s job limit is left for flushing PIDDateData, saving the checkpoint and logging the run
+CONNECTIVITY_RUN_DEADLINE = 3000.0
+
+# Scraper settings
+SCRAPE_PREFETCH_PAGES = 8      # Archive pages kept in flight ahead of the consumer (at most)
+SCRAPE_MAX_CONCURRENCY = 4     # Simultaneous requests to pressinform.gov.bd
+SCRAPE_MIN_INTERVAL = 0.25     # Minimum seconds between request starts (politeness)
+SCRAPE_CHECKPOINT_SIZE = 10    # Newest already-handled entries remembered between runs
+
+# Shared HTTP client: per-host concurrent requests, seconds between request starts and timeout
+HTTP_HOSTS = {
+    'pressinform.gov.bd': {'concurrency': SCRAPE_MAX_CONCURRENCY, 'min_interval': SCRAPE_MIN_INTERVAL, 'timeout': 10},
+    'commons.wikimedia.org': {'concurrency': 2, 'min_interval': 0.0, 'timeout': 30},
+    'archive.org': {'concurrency': 2, 'min_interval': 0.5, 'timeout': 30},
+    'web.archive.org': {'concurrency': 2, 'min_interval': 0.5, 'timeout': 30},
+    'www.google.com': {'concurrency': 1, 'min_interval': 0.0, 'timeout': 5},
+}
+HTTP_DEFAULT_HOST = {'concurrency': 4, 'min_interval': 0.0, 'timeout': 30}
+
+# Row pipeline settings: worker threads per stage and bounded queue size between stages
+PIPELINE_WORKERS = {
+    'process': 2,    # Download and separator detection
+    'ocr': 1,        # Batched Vision OCR
+    'translate': 2,  # Gemini translation
+    'title': 2,      # Gemini title generation
+    'upload': 3,     # Concurrent Commons uploads (PIDDateData edits are buffered and written one at a time)
+}
+PIPELINE_QUEUE_SIZE = 4
+PIPELINE_BATCH_WAIT = 2.0      # Seconds a batched stage waits to fill a batch
+OCR_BATCH_SIZE = 16            # Vision batch_annotate_images accepts up to 16 images
+OCR_BATCH_MAX_BYTES = 8 * 1024 * 1024  # Keep batch requests under the 10 MB request limit
+BATCH_TRANSLATION = True       # Pack several captions into one structured Gemini request
+TRANSLATION_BATCH_SIZE = 8
+STRUCTURED_REQUEST_ATTEMPTS = 2  # Per model for batched/fused requests before falling back to single calls
+FUSED_TRANSLATE_TITLE = False  # Get translation and filename from one Gemini request per row
+RESUME_PREVIOUS_RUNS = True    # Reuse stage outputs of runs that were killed before logging
+LOSSLESS_JPEG_CROP = True      # Cut JPEG photo sections with jpegtran instead of re-encoding them
+JPEGTRAN_PATH = shutil.which('jpegtran')  # From libjpeg-turbo-progs; main() notes once when it is missing
+# Source formats kept on upload, as PIL format -> file extension. Anything else is uploaded as JPEG:
+# GIF palettes and WebP re-encoding would lose quality. Pillow reads camera JPEGs with an MPF index as MPO.
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'MPO': 'jpg', 'PNG': 'png', 'TIFF': 'tif'}
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # Files larger than this are uploaded to the stash in chunks of this size
+UPLOAD_COMMENT = "Pypan 0.1.1a0"
+UPLOAD_TITLE_WARNINGS = ('exists', 'exists-normalized', 'page-exists')  # Upload warnings meaning the title is taken
+UPLOAD_DUPLICATE_WARNINGS = ('duplicate', 'duplicate-archive')          # Upload warnings meaning the photo is already on Commons
+UPLOAD_RETRY_WAIT = 5.0        # First retry delay when the server gives no hint; doubles up to MAX_BACKOFF
+DUPLICATE_CHECK = True         # Skip rows whose photo matches an uploaded (or in-flight) photo by perceptual hash
+DUPLICATE_MAX_DISTANCE = 3     # Differing bits of the 64-bit dHash still treated as the same photo
+DUPLICATE_MAX_ASPECT_DIFF = 0.01  # Relative aspect ratio difference a match may have (confirms the hash)
+PID_FLUSH_SIZE = 50            # PIDDateData entries written per module edit
+PID_FLUSH_INTERVAL = 600       # Seconds after which buffered entries are written even if the chunk is not full
+TITLE_CHECK_BATCH_SIZE = 50    # Titles per existence query (the API limit for normal accounts)
+TITLE_ALTERNATIVES = 5         # Numbered variants tried when a generated title is taken
+
+# Wayback Machine lookups for images that return 404
+WAYBACK_CDX_URL = "http://web.archive.org/cdx/search/cdx"
+WAYBACK_SNAPSHOT_URL = "http://web.archive.org/web"
+WAYBACK_ATTEMPTS = 3                      # CDX attempts per URL on network or server errors
+WAYBACK_NEGATIVE_TTL = 7 * 24 * 3600      # Seconds a "no snapshot" answer is trusted; snapshots are kept forever
+
+# Spreadsheet columns, in order, as stored in the run state database
+RUN_COLUMNS = [
+    'unique_id', 'date', 'image_url', 'blank', 'ocr_text', 'status', 'translation', 'trans_status',
+    'title', 'title_status', 'data_entry', 'pid_status', 'description', 'upload_status',
+]
+
+LLM_CACHE_MAX_ENTRIES = 20000  # Cached translations/titles kept before least recently used are evicted
+
 # Google Cloud credentials - will be loaded from JSON file
 GOOGLE_CREDENTIALS = None
 
+# Persistent translation/title cache - opened by main()
+LLM_CACHE = None
+
 TRANSLATION_PROMPT = (
     'Translate the following Bengali text into English in enclyclopedic style. '
     'You may rearrange words or sentences for clarity, but retain all information. '
@@ -60,12 +166,52 @@ TRANSLATION_PROMPT = (
     'Text: "{text}"'
 )
 
+BATCH_TRANSLATION_PROMPT = (
+    'Translate each of the following Bengali texts into English in enclyclopedic style. '
+    'You may rearrange words or sentences for clarity, but retain all information. '
+    'Do not add or omit anything. Do not have any bengali text in your answers, no options and no explanations. '
+    'The input is a JSON list of objects with "id" and "text". Return one object per input with the same "id" '
+    'and only the English translation of its text in "translation". '
+    'Input: {items}'
+)
+
+TRANSLATION_RESPONSE_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'id': {'type': 'STRING'},
+            'translation': {'type': 'STRING'},
+        },
+        'required': ['id', 'translation'],
+    },
+}
+
 TITLE_PROMPT = (
     'Convert this image description (below) into a single Wikimedia Commons–compliant filename (do NOT add the "File:" prefix, or wikitext, or Title:, do not add filename extention). Follow Wikimedia Commons file naming guidelines: be descriptive, specific, precise, concise and neutral; include date as YYYY-MM-DD if present; avoid photographer/source-only names. Remove any political bias or references to previous governments and strip flattering/propagandistic/honorific language. Output ONLY the filename (no explanation), Regular Case, remove illegal filesystem characters but KEEP spaces and comma and hyphen, keep ≤240 bytes, and do not add filename extention. '
     'Text: "{text}"'
 )
 
+DESCRIBE_PROMPT = (
+    'Translate the following Bengali text into English in enclyclopedic style, then convert that translation into a filename. '
+    'For "translation": you may rearrange words or sentences for clarity, but retain all information. '
+    'Do not add or omit anything. Do not have any bengali text in it, no options and no explanations. '
+    'For "title": a single Wikimedia Commons–compliant filename for the translation (do NOT add the "File:" prefix, or wikitext, or Title:, do not add filename extention). Follow Wikimedia Commons file naming guidelines: be descriptive, specific, precise, concise and neutral; include date as YYYY-MM-DD if present; avoid photographer/source-only names. Remove any political bias or references to previous governments and strip flattering/propagandistic/honorific language. Regular Case, remove illegal filesystem characters but KEEP spaces and comma and hyphen, keep ≤240 bytes. '
+    'Photo date: "{date}" '
+    'Text: "{text}"'
+)
+
+DESCRIBE_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'translation': {'type': 'STRING'},
+        'title': {'type': 'STRING'},
+    },
+    'required': ['translation', 'title'],
+}
+
 import socket
+import urllib3.exceptions
 import urllib3.util.connection as urllib3_cn
 
 def allowed_gai_family():
@@ -104,6 +250,271 @@ def retry_on_failure(max_attempts=10, delay=2):
         return wrapper
     return decorator
 
+# ============================================================================
+# CONNECTIVITY MONITOR
+# ============================================================================
+
+TRANSPORT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.NewConnectionError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.TimeoutError,
+    socket.timeout,
+    socket.gaierror,
+    ConnectionError,
+    # Vision and Translate raise these once gRPC or their own retries give up on the connection
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.RetryError,
+)
+
+def is_transport_error(error):
+    """Check whether an exception means the network, rather than the request, failed"""
+    # Client libraries (httpx under google-genai, gRPC) wrap the socket error, so walk the chain
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, TRANSPORT_ERRORS):
+            return True
+        seen.add(id(error))
+        error = error.__cause__
+    return False
+
+class ConnectivityMonitor:
+    """Circuit breaker shared by all network calls
+
+    Real requests report their outcome, so a healthy connection costs nothing
+    extra. After CONNECTIVITY_FAILURE_THRESHOLD consecutive transport errors the
+    circuit opens: callers block while a background thread probes with
+    check_internet() at growing intervals, and the circuit closes again once a
+    probe succeeds. No caller waits past run_deadline seconds after the monitor
+    was created, however many outages the run has.
+    """
+
+    def __init__(self, failure_threshold=CONNECTIVITY_FAILURE_THRESHOLD,
+                 probe_interval=CONNECTIVITY_PROBE_INTERVAL, max_probe_interval=CONNECTIVITY_MAX_PROBE_INTERVAL,
+                 run_deadline=CONNECTIVITY_RUN_DEADLINE):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.deadline = time.monotonic() + run_deadline
+        self.outages = 0
+        self._failures = 0
+        self._online = threading.Event()
+        self._online.set()
+        self._lock = threading.Lock()
+
+    def wait_until_online(self, timeout=CONNECTIVITY_MAX_WAIT):
+        """Block while the circuit is open; returns False if still offline after timeout seconds or at the run deadline"""
+        if not self._online.is_set():
+            timeout = max(0.0, min(timeout, self.deadline - time.monotonic()))
+            print(f"Waiting up to {timeout:.0f}s for internet connection...")
+            if not self._online.wait(timeout):
+                print(f"Still offline after {timeout:.0f}s, giving up on this request")
+                return False
+        return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self, error):
+        if not is_transport_error(error):
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.failure_threshold or not self._online.is_set():
+                return
+            self._online.clear()
+            self.outages += 1
+        print(f"Connection lost after {self.failure_threshold} consecutive network errors, pausing requests")
+        threading.Thread(target=self._probe, daemon=True).start()
+
+    def _probe(self):
+        delay = self.probe_interval
+        while not check_internet():
+            print(f"Still offline, probing again in {delay:.0f}s")
+            sleep(delay)
+            delay = min(delay * 2, self.max_probe_interval)
+        with self._lock:
+            self._failures = 0
+            self._online.set()
+        print("Internet connection restored, resuming requests")
+
+    def call(self, func, *args, **kwargs):
+        """Call func once the circuit is closed and record whether the network held up"""
+        if not self.wait_until_online():
+            raise ConnectionError("No internet connection")
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+CONNECTIVITY = ConnectivityMonitor()
+
+# ============================================================================
+# HTTP CLIENT
+# ============================================================================
+
+class HostPool:
+    """Keep-alive session, request slots and counters for one host"""
+
+    def __init__(self, host, settings):
+        self.host = host
+        self.timeout = settings['timeout']
+        self.min_interval = settings['min_interval']
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings['concurrency'])
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.slots = threading.Semaphore(settings['concurrency'])
+
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait_turn(self):
+        """Space request starts at least min_interval apart"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            sleep(start - now)
+
+    def record(self, seconds, size, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.bytes += size
+            self.seconds += seconds
+
+class HTTPClient:
+    """Outbound HTTP shared by all stages, pooled per host with the limits in HTTP_HOSTS"""
+
+    def __init__(self, hosts=HTTP_HOSTS, default=HTTP_DEFAULT_HOST):
+        self.hosts = hosts
+        self.default = default
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, host):
+        with self._lock:
+            if host not in self._pools:
+                self._pools[host] = HostPool(host, {**self.default, **self.hosts.get(host, {})})
+            return self._pools[host]
+
+    def get(self, url, check_connectivity=True, **kwargs):
+        """GET url through the host's pool; the connectivity probe itself bypasses the circuit breaker"""
+        pool = self._pool(urlparse(url).hostname or '')
+        kwargs.setdefault('timeout', pool.timeout)
+
+        with pool.slots:
+            pool.wait_turn()
+            start = time.monotonic()
+            try:
+                if check_connectivity:
+                    response = CONNECTIVITY.call(pool.session.get, url, **kwargs)
+                else:
+                    response = pool.session.get(url, **kwargs)
+            except Exception:
+                pool.record(time.monotonic() - start, 0, error=True)
+                raise
+            pool.record(time.monotonic() - start, len(response.content))
+        return response
+
+    def stats(self):
+        """One summary line per host contacted"""
+        with self._lock:
+            pools = list(self._pools.values())
+        return [
+            f"{pool.host}: {pool.requests} requests, {pool.errors} errors, {pool.bytes / 1024 / 1024:.1f} MB, "
+            f"{pool.seconds / pool.requests if pool.requests else 0:.2f}s average"
+            for pool in pools
+        ]
+
+HTTP = HTTPClient()
+
+# ============================================================================
+# RATE LIMITING
+# ============================================================================
+
+def is_rate_limit_error(error):
+    """Check whether an API exception is a quota/rate limit rejection, by exception type or HTTP status"""
+    if isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)):
+        return True
+    # google.genai errors carry the status as .code, requests' HTTPError on its response
+    status = getattr(error, 'code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429
+
+class RateLimiter:
+    """Token bucket shared by all threads calling one API
+
+    The rate adapts AIMD-style: it grows by RATE_LIMIT_INCREASE after each
+    successful request and is multiplied by RATE_LIMIT_DECREASE whenever the
+    API answers with a rate limit error.
+    """
+
+    def __init__(self, name, rate, min_rate, max_rate):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.throttled = 0
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the bucket grants a request"""
+        with self._lock:
+            now = time.monotonic()
+            burst = max(1.0, self.rate)
+            self._tokens = min(burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token; a negative balance is the wait of the queued callers
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_LIMIT_INCREASE)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * RATE_LIMIT_DECREASE)
+            self._tokens = min(self._tokens, 0.0)
+            self.throttled += 1
+        print(f"{self.name}: rate limited, slowing down to {self.rate:.2f} requests/s")
+
+    def call(self, func, *args, **kwargs):
+        """Call func once the bucket allows it and adapt the rate to the outcome"""
+        self.acquire()
+        try:
+            result = CONNECTIVITY.call(func, *args, **kwargs)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.on_throttle()
+            raise
+        self.on_success()
+        return result
+
+    def stats(self):
+        return f"{self.name} {self.rate:.2f} requests/s ({self.throttled} throttled)"
+
+RATE_LIMITERS = {name: RateLimiter(name, *limits) for name, limits in RATE_LIMITS.items()}
+
 # ============================================================================
 # SCRAPER FUNCTIONS
 # ============================================================================
@@ -127,6 +538,139 @@ def generate_unique_id(img_url, date_str, counter):
     unique_id = f"PID_{date_part}{url_hash}_{counter:04d}"
     return unique_id
 
+def parse_pid_date_data(content):
+    """Parse Module:PIDDateData text into a dict of normalized URL -> date"""
+    entries = {}
+    pattern = r'\["(http[^"]+)"\](?:\s*=\s*"([^"]*)")?'
+    for url, date in re.findall(pattern, content):
+        entries[normalize_url(url)] = date
+    return entries
+
+class PIDDateIndex:
+    """Local SQLite index of Module:PIDDateData entries, refreshed by revision ID
+
+    A changed module year replaces that year's entries, so entries edited or
+    removed on the wiki are updated here too. Entries recorded locally by add()
+    are kept until the module lists them, as their edit may still be buffered.
+    """
+
+    API_URL = "https://commons.wikimedia.org/w/api.php"
+
+    def __init__(self, path=PID_INDEX_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries (url TEXT PRIMARY KEY, date TEXT, year INTEGER, local INTEGER DEFAULT 0)'
+        )
+        if 'local' not in [row[1] for row in self.conn.execute('PRAGMA table_info(entries)')]:
+            self.conn.execute('ALTER TABLE entries ADD COLUMN local INTEGER DEFAULT 0')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS revisions (year INTEGER PRIMARY KEY, revid INTEGER, fetched TEXT)'
+        )
+        self.conn.commit()
+
+    def __contains__(self, normalized_url):
+        with self._lock:
+            row = self.conn.execute('SELECT 1 FROM entries WHERE url = ?', (normalized_url,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def count(self, year):
+        """Number of indexed entries for one module year"""
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM entries WHERE year = ?', (year,)).fetchone()[0]
+
+    def cached_revid(self, year):
+        with self._lock:
+            row = self.conn.execute('SELECT revid FROM revisions WHERE year = ?', (year,)).fetchone()
+        return row[0] if row else None
+
+    def add_entries(self, entries, year, local=False):
+        """Insert parsed entries, keeping the ones already indexed"""
+        with self._lock:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO entries (url, date, year, local) VALUES (?, ?, ?, ?)',
+                [(url, date, year, int(local)) for url, date in entries.items()]
+            )
+            self.conn.commit()
+
+    def replace_entries(self, entries, year, revid):
+        """Make one year's entries match a module revision, in a single transaction"""
+        with self._lock:
+            self.conn.execute('DELETE FROM entries WHERE year = ? AND local = 0', (year,))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO entries (url, date, year, local) VALUES (?, ?, ?, 0)',
+                [(url, date, year) for url, date in entries.items()]
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO revisions (year, revid, fetched) VALUES (?, ?, ?)',
+                (year, revid, datetime.now().isoformat(timespec='seconds'))
+            )
+            self.conn.commit()
+
+    def add(self, url, date, year=None):
+        """Record a single uploaded entry"""
+        self.add_entries({normalize_url(url): date}, year or datetime.now().year, local=True)
+
+    def _query_revision(self, year, with_content):
+        """Return (revid, content) of the latest module revision"""
+        params = {
+            'action': 'query',
+            'titles': f'Module:PIDDateData/{year}',
+            'prop': 'revisions',
+            'rvprop': 'ids|content' if with_content else 'ids',
+            'rvslots': 'main',
+            'format': 'json',
+            'formatversion': 2,
+        }
+        response = HTTP.get(self.API_URL, params=params, headers={'User-Agent': 'PressInformScraper/1.0 Python/requests'})
+        response.raise_for_status()
+
+        pages = response.json().get('query', {}).get('pages', [])
+        if not pages or not pages[0].get('revisions'):
+            return None, None
+
+        revision = pages[0]['revisions'][0]
+        content = revision.get('slots', {}).get('main', {}).get('content') if with_content else None
+        return revision['revid'], content
+
+    def refresh(self, year):
+        """Bring one module year up to date, downloading it only when the revid changed"""
+        cached = self.cached_revid(year)
+        try:
+            revid, _ = self._query_revision(year, with_content=False)
+            if revid is None:
+                print(f"Module:PIDDateData/{year} not found")
+                return False
+            if revid == cached:
+                print(f"Module:PIDDateData/{year} unchanged (revision {revid}), {self.count(year)} URLs cached")
+                return True
+
+            print(f"Module:PIDDateData/{year} changed ({cached} -> {revid}), downloading")
+            revid, content = self._query_revision(year, with_content=True)
+            entries = parse_pid_date_data(content or '')
+            print(f"Found {len(entries)} URLs in {year} module")
+            if not entries:
+                return False
+            self.replace_entries(entries, year, revid)
+            return True
+
+        except Exception as e:
+            print(f"Error refreshing PIDDateData index for {year}: {e}")
+
+        # Fall back to the raw page variants, keeping whatever was cached before
+        urls = fetch_wikimedia_data(year)
+        if urls:
+            self.add_entries({url: None for url in urls}, year)
+            return True
+        return cached is not None
+
 def fetch_wikimedia_data(year):
     """Fetch data from Wikimedia Module:PIDDateData for given year"""
     headers = {
@@ -142,7 +686,7 @@ def fetch_wikimedia_data(year):
     for url in urls_to_try:
         try:
             print(f"Trying URL: {url}")
-            response = requests.get(url, headers=headers, timeout=10)
+            response = HTTP.get(url, headers=headers)
             print(f"Status code: {response.status_code}")
 
             if response.status_code == 200:
@@ -164,14 +708,8 @@ def fetch_wikimedia_data(year):
                 if len(content) < 50:
                     continue
 
-                urls = set()
-                pattern = r'\["(http[^"]+)"\]'
-                matches = re.findall(pattern, content)
-                print(f"Found {len(matches)} URLs in {year} module")
-
-                for match in matches:
-                    normalized = normalize_url(match)
-                    urls.add(normalized)
+                urls = set(parse_pid_date_data(content))
+                print(f"Found {len(urls)} URLs in {year} module")
 
                 if len(urls) > 0:
                     return urls
@@ -201,7 +739,7 @@ def scrape_page(page_num, wikimedia_urls):
     max_retries = 10
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=10)
+            response = HTTP.get(url)
             if response.status_code != 200:
                 print(f"Failed to fetch page {page_num}")
                 return []
@@ -249,66 +787,184 @@ def scrape_page(page_num, wikimedia_urls):
                 print(f"Failed after {max_retries} attempts")
                 return []
 
+def load_scrape_checkpoint(path=SCRAPE_CHECKPOINT_FILE):
+    """Load the newest already-handled archive entries from the last run"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        urls = set()
+        dates = []
+        for entry in data['entries']:
+            urls.add(entry['url'])
+            match = re.match(r'\d{4}-\d{2}-\d{2}', entry.get('date') or '')
+            if match:
+                dates.append(match.group(0))
+
+        if not urls:
+            return None
+
+        print(f"Loaded scrape checkpoint with {len(urls)} entries")
+        return {'urls': urls, 'oldest_date': min(dates) if dates else None, 'entries': data['entries']}
+
+    except FileNotFoundError:
+        print("No scrape checkpoint found, using consecutive match heuristic")
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"Scrape checkpoint unreadable ({e}), using consecutive match heuristic")
+        return None
+
+def save_scrape_checkpoint(entries, path=SCRAPE_CHECKPOINT_FILE):
+    """Atomically record the newest already-handled archive entries"""
+    data = {
+        'updated': datetime.now().isoformat(timespec='seconds'),
+        'entries': entries,
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not save scrape checkpoint: {e}")
+
+def is_checkpoint_entry(checkpoint, normalized_url, date):
+    """Check whether an already-handled entry is at or past the checkpoint"""
+    if normalized_url in checkpoint['urls']:
+        return True
+    match = re.match(r'\d{4}-\d{2}-\d{2}', date or '')
+    return bool(match and checkpoint['oldest_date'] and match.group(0) < checkpoint['oldest_date'])
+
+class PageFetcher:
+    """Prefetch archive pages concurrently while handing them out in page order"""
+
+    def __init__(self, wikimedia_urls, window=SCRAPE_PREFETCH_PAGES, max_concurrency=SCRAPE_MAX_CONCURRENCY):
+        self.wikimedia_urls = wikimedia_urls
+        self.window = max(1, window)
+
+        # Connection reuse and request spacing come from the pressinform.gov.bd pool in HTTP
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def _fetch(self, page_num):
+        return scrape_page(page_num, self.wikimedia_urls)
+
+    def pages(self, start_page=1, initial_window=None):
+        """Yield (page_num, results) in page order with a window of pages in flight
+
+        The window starts at initial_window and doubles up to self.window each
+        time the consumer asks for another page, so a run that stops on the
+        first page (a checkpoint hit) fetches only that page.
+        """
+        window = min(initial_window or self.window, self.window)
+        pending = deque()
+        next_page = start_page
+        try:
+            while True:
+                while len(pending) < window:
+                    pending.append((next_page, self.executor.submit(self._fetch, next_page)))
+                    next_page += 1
+
+                page_num, future = pending.popleft()
+                yield page_num, future.result()
+                window = min(window * 2, self.window)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        """Drop queued pages"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 def scrape_data():
     """Scrape data from pressinform.gov.bd"""
     from bs4 import BeautifulSoup
 
-    output_dir = os.path.expanduser('~/output')
+    output_dir = OUTPUT_DIR
     os.makedirs(output_dir, exist_ok=True)
 
     current_year = datetime.now().year
     previous_year = current_year - 1
 
     print(f"Current year: {current_year}")
-    print("Fetching Wikimedia data...")
-    wikimedia_urls = fetch_wikimedia_data(current_year)
-    print(f"Loaded {len(wikimedia_urls)} URLs from {current_year}")
-    prev_year_urls = fetch_wikimedia_data(previous_year)
-    print(f"Loaded {len(prev_year_urls)} URLs from {previous_year}")
-    wikimedia_urls.update(prev_year_urls)
+    print("Refreshing local PIDDateData index...")
+    wikimedia_urls = PIDDateIndex()
+    for year in (current_year, previous_year):
+        wikimedia_urls.refresh(year)
+        print(f"Indexed {wikimedia_urls.count(year)} URLs from {year}")
     print(f"Total URLs from Wikimedia: {len(wikimedia_urls)}")
+    # Rows skipped as duplicates never reach PIDDateData but are just as handled
+    skipped_urls = PhotoHashIndex().skipped_urls()
+    if skipped_urls:
+        print(f"URLs skipped as duplicates: {len(skipped_urls)}")
 
     wb = Workbook()
     ws = wb.active
 
     consecutive_matches = 0
-    page_num = 1
     entry_counter = 1
 
-    while consecutive_matches < 50:
-        results = scrape_page(page_num, wikimedia_urls)
+    # Already-handled entries seen after the most recent new one become the next checkpoint
+    checkpoint = load_scrape_checkpoint()
+    handled_entries = []
+    reached_checkpoint = False
 
-        if not results:
-            print(f"No results found on page {page_num}")
-            consecutive_matches += 1
-            page_num += 1
-            time.sleep(1)
-            continue
+    fetcher = PageFetcher(wikimedia_urls)
+    try:
+        # With a checkpoint a quiet day usually stops on page 1, so prefetch only once it does not
+        for page_num, results in fetcher.pages(initial_window=1 if checkpoint else None):
+            if not results:
+                print(f"No results found on page {page_num}")
+                consecutive_matches += 1
+                if consecutive_matches >= 50:
+                    break
+                continue
 
-        page_has_new = False
-        for img_url, date in results:
-            normalized_url = normalize_url(img_url)
+            page_has_new = False
+            for img_url, date in results:
+                normalized_url = normalize_url(img_url)
 
-            if normalized_url in wikimedia_urls:
-                print(f"Skipping (already in Wikimedia): {img_url}")
-                consecutive_matches += 1
-            else:
-                unique_id = generate_unique_id(img_url, date, entry_counter)
-                print(f"Adding: {unique_id} | {date} | {img_url}")
-                ws.append([unique_id, date, img_url])
-                entry_counter += 1
-                consecutive_matches = 0
-                page_has_new = True
-
-        if not page_has_new:
-            print(f"All entries on page {page_num} already exist in Wikimedia")
-
-        if consecutive_matches >= 50:
-            print(f"\nFound 50 consecutive matches. Stopping.")
-            break
+                if normalized_url in wikimedia_urls or normalized_url in skipped_urls:
+                    if normalized_url in skipped_urls:
+                        print(f"Skipping (duplicate of an uploaded photo): {img_url}")
+                    else:
+                        print(f"Skipping (already in Wikimedia): {img_url}")
+                    consecutive_matches += 1
+
+                    if len(handled_entries) < SCRAPE_CHECKPOINT_SIZE:
+                        handled_entries.append({'url': normalized_url, 'date': date})
 
-        page_num += 1
-        time.sleep(1)
+                    if checkpoint and is_checkpoint_entry(checkpoint, normalized_url, date):
+                        reached_checkpoint = True
+                        break
+                else:
+                    unique_id = generate_unique_id(img_url, date, entry_counter)
+                    print(f"Adding: {unique_id} | {date} | {img_url}")
+                    ws.append([unique_id, date, img_url])
+                    entry_counter += 1
+                    consecutive_matches = 0
+                    page_has_new = True
+                    handled_entries = []
+
+            if not page_has_new:
+                print(f"All entries on page {page_num} already exist in Wikimedia")
+
+            if reached_checkpoint:
+                print(f"\nReached scrape checkpoint on page {page_num}. Stopping.")
+                break
+
+            if consecutive_matches >= 50:
+                print(f"\nFound 50 consecutive matches. Stopping.")
+                break
+    finally:
+        fetcher.close()
+
+    if handled_entries:
+        if reached_checkpoint:
+            # Entries below the stop point are still valid; keep the newest ones
+            seen = {entry['url'] for entry in handled_entries}
+            handled_entries += [entry for entry in checkpoint['entries'] if entry['url'] not in seen]
+        save_scrape_checkpoint(handled_entries[:SCRAPE_CHECKPOINT_SIZE])
 
     # Check if any new entries were added
     if entry_counter == 1:  # No new entries found
@@ -323,13 +979,102 @@ def scrape_data():
 
     return output_file
 
+# ============================================================================
+# WAYBACK RESOLVER
+# ============================================================================
+
+class WaybackResolver:
+    """Find the oldest archived copy of a URL with one CDX query, remembering the answers
+
+    Snapshots are cached permanently and "no snapshot" answers for
+    negative_ttl seconds. Network failures are not cached.
+    """
+
+    def __init__(self, path=WAYBACK_CACHE_FILE, cdx_url=WAYBACK_CDX_URL, negative_ttl=WAYBACK_NEGATIVE_TTL,
+                 snapshot_url=WAYBACK_SNAPSHOT_URL):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.cdx_url = cdx_url
+        self.snapshot_url = snapshot_url
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS snapshots (url TEXT PRIMARY KEY, snapshot TEXT, checked REAL)')
+        self.conn.commit()
+
+    def cached(self, url):
+        """Return (found, snapshot_url) from the cache; snapshot_url is None for a known miss"""
+        with self._lock:
+            row = self.conn.execute('SELECT snapshot, checked FROM snapshots WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return False, None
+        snapshot, checked = row
+        if snapshot is None and time.time() - checked > self.negative_ttl:
+            return False, None
+        return True, snapshot
+
+    def _store(self, url, snapshot):
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO snapshots (url, snapshot, checked) VALUES (?, ?, ?)', (url, snapshot, time.time())
+            )
+            self.conn.commit()
+
+    def _query(self, url):
+        """Oldest successful capture of url as a snapshot URL, or None when there is none"""
+        params = {
+            'url': url,
+            'limit': 1,
+            'output': 'json',
+            'fl': 'timestamp,original',
+            'filter': 'statuscode:200',
+        }
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        response = HTTP.get(self.cdx_url, params=params, headers=headers)
+        response.raise_for_status()
+
+        # First row is the field header; captures are sorted oldest first
+        rows = response.json() if response.text.strip() else []
+        if len(rows) < 2:
+            return None
+        timestamp, original_url = rows[1][0], rows[1][1]
+        return f"{self.snapshot_url}/{timestamp}/{original_url}"
+
+    def resolve(self, url):
+        """Return (snapshot_url, error) like the other lookups"""
+        found, snapshot = self.cached(url)
+        if found:
+            return (snapshot, None) if snapshot else (None, "No archived version found (cached)")
+
+        last_error = None
+        for attempt in range(WAYBACK_ATTEMPTS):
+            try:
+                snapshot = self._query(url)
+            except Exception as e:
+                last_error = e
+                if attempt < WAYBACK_ATTEMPTS - 1:
+                    sleep(2 ** attempt)
+                continue
+
+            self._store(url, snapshot)
+            return (snapshot, None) if snapshot else (None, "No archived version found")
+
+        return None, f"Wayback Machine error: {str(last_error)}"
+
 # ============================================================================
 # IMAGE PROCESSOR FUNCTIONS
 # ============================================================================
 
 class ImageProcessor:
-    def __init__(self):
+    # Caption background colours (RGB) and per-channel match tolerance
+    BACKGROUND_COLORS = ([255, 255, 255], [251, 249, 250])
+    COLOR_TOLERANCE = 255 * 0.02
+
+    def __init__(self, wayback=None):
         self.vision_client = None
+        self.wayback = wayback or WaybackResolver()
 
     def initialize_vision_client(self):
         """Initialize Google Cloud Vision API client"""
@@ -340,152 +1085,116 @@ class ImageProcessor:
         except Exception as e:
             return False, f"Failed to initialize Vision API: {str(e)}"
 
-    @retry_on_failure(max_attempts=10, delay=2)
     def get_wayback_url(self, url):
         """Get the oldest archived version from Wayback Machine"""
-        try:
-            encoded_url = quote(url, safe='')
-            api_url = f"http://archive.org/wayback/available?url={encoded_url}"
+        return self.wayback.resolve(url)
+
+    # EXIF orientation tag values mapped to the cv2 flips and rotations that undo them;
+    # these copy in cache-friendly blocks, unlike materializing a transposed NumPy view
+    ORIENTATION_TRANSFORMS = {
+        2: lambda a: cv2.flip(a, 1),
+        3: lambda a: cv2.rotate(a, cv2.ROTATE_180),
+        4: lambda a: cv2.flip(a, 0),
+        5: lambda a: cv2.transpose(a),
+        6: lambda a: cv2.rotate(a, cv2.ROTATE_90_CLOCKWISE),
+        7: lambda a: cv2.flip(cv2.transpose(a), -1),
+        8: lambda a: cv2.rotate(a, cv2.ROTATE_90_COUNTERCLOCKWISE),
+    }
 
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(api_url, headers=headers, timeout=30)
-            response.raise_for_status()
+    def decode_image(self, content):
+        """Decode image bytes once into an upright RGB array; returns (image, format, exif)
 
-            data = response.json()
+        All stages share this layout: segmentation slices it, OCR encodes the
+        text strip and uploads build the PIL image straight from the photo view.
+        """
+        from PIL import ImageFile
+        ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-            if data.get('archived_snapshots') and data['archived_snapshots'].get('closest'):
-                wayback_url = data['archived_snapshots']['closest']['url']
+        img_pil = Image.open(BytesIO(content))
 
-                cdx_url = f"http://web.archive.org/cdx/search/cdx?url={encoded_url}&limit=1&output=json"
-                cdx_response = requests.get(cdx_url, headers=headers, timeout=30)
+        # Store EXIF data and the source format before any processing
+        exif_data = img_pil.info.get('exif', None)
+        img_format = UPLOAD_FORMATS.get(img_pil.format, 'jpg')
+        orientation = img_pil.getexif().get(0x0112, 1)
 
-                if cdx_response.status_code == 200:
-                    cdx_data = cdx_response.json()
-                    if len(cdx_data) > 1:
-                        timestamp = cdx_data[1][1]
-                        original_url = cdx_data[1][2]
-                        oldest_url = f"http://web.archive.org/web/{timestamp}/{original_url}"
-                        return oldest_url, None
+        # CMYK, greyscale, palette and alpha images all become 3-channel RGB;
+        # cv2 expands greyscale several times faster than PIL's convert
+        if img_pil.mode == 'L':
+            image = cv2.cvtColor(np.asarray(img_pil), cv2.COLOR_GRAY2RGB)
+        else:
+            if img_pil.mode != 'RGB':
+                img_pil = img_pil.convert('RGB')
+            image = np.asarray(img_pil)
 
-                return wayback_url, None
-            else:
-                return None, "No archived version found"
+        # Upright images are used as decoded; only oriented ones are copied
+        if orientation in self.ORIENTATION_TRANSFORMS:
+            image = self.ORIENTATION_TRANSFORMS[orientation](image)
 
-        except Exception as e:
-            return None, f"Wayback Machine error: {str(e)}"
+        return image, img_format, exif_data
 
     def download_image(self, url):
-        """Download image from URL and return image with its extension"""
+        """Download image from URL and return image, extension, EXIF and the downloaded bytes"""
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=30)
+            response = HTTP.get(url, headers=headers)
             response.raise_for_status()
 
-            from PIL import ImageFile, ImageOps
-            ImageFile.LOAD_TRUNCATED_IMAGES = True
-
-            img_pil = Image.open(BytesIO(response.content))
-
-            # Store EXIF data before any processing
-            exif_data = img_pil.info.get('exif', None)
-
-            # CRITICAL FIX: Apply EXIF orientation before any processing
-            img_pil = ImageOps.exif_transpose(img_pil)
-
-            # CRITICAL FIX: Convert CMYK to RGB if needed
-            if img_pil.mode == 'CMYK':
-                # Convert CMYK to RGB using PIL's conversion
-                img_pil = img_pil.convert('RGB')
-            elif img_pil.mode not in ('RGB', 'L', 'RGBA'):
-                # Convert any other color mode to RGB
-                img_pil = img_pil.convert('RGB')
-
-            # Detect image format
-            img_format = img_pil.format.lower() if img_pil.format else 'jpg'
-            if img_format == 'jpeg':
-                img_format = 'jpg'
-
-            # Convert PIL to numpy array
-            img_np = np.array(img_pil)
-
-            # Convert to OpenCV BGR format
-            if len(img_np.shape) == 2:
-                # Grayscale
-                img_cv = cv2.cvtColor(img_np, cv2.COLOR_GRAY2BGR)
-            elif len(img_np.shape) == 3:
-                if img_np.shape[2] == 4:
-                    # RGBA
-                    img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGBA2BGR)
-                elif img_np.shape[2] == 3:
-                    # RGB - convert to BGR for OpenCV
-                    img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-                else:
-                    img_cv = img_np
-            else:
-                return None, None, "Invalid image format"
-
-            return img_cv, img_format, exif_data, None
+            image, img_format, exif_data = self.decode_image(response.content)
+            return image, img_format, exif_data, response.content, None
 
         except requests.exceptions.RequestException as e:
             if "404" in str(e) or (hasattr(e, 'response') and e.response is not None and e.response.status_code == 404):
                 wayback_url, wayback_error = self.get_wayback_url(url)
                 if wayback_url:
                     try:
-                        headers = {
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                        }
-                        response = requests.get(wayback_url, headers=headers, timeout=30)
+                        response = HTTP.get(wayback_url, headers=headers)
                         response.raise_for_status()
 
-                        from PIL import ImageFile, ImageOps
-                        ImageFile.LOAD_TRUNCATED_IMAGES = True
+                        image, img_format, exif_data = self.decode_image(response.content)
+                        return image, img_format, exif_data, response.content, "Retrieved from Wayback Machine"
 
-                        img_pil = Image.open(BytesIO(response.content))
+                    except Exception as wb_e:
+                        return None, None, None, None, f"404 error - Wayback Machine also failed: {str(wb_e)}"
+                else:
+                    return None, None, None, None, f"404 error - {wayback_error}"
+            return None, None, None, None, f"Download failed: {str(e)}"
+        except Exception as e:
+            return None, None, None, None, f"Image processing error: {str(e)}"
 
-                        # Store EXIF data before any processing
-                        exif_data = img_pil.info.get('exif', None)
+    def measure_uniform_columns(self, image, columns, start_row):
+        """Measure the uniform colour run above the bottom edge for all columns at once"""
+        height = image.shape[0]
+        bottom_row = height - 6
 
-                        # CRITICAL FIX: Apply EXIF orientation
-                        img_pil = ImageOps.exif_transpose(img_pil)
+        if bottom_row < start_row:
+            return {}
 
-                        # CRITICAL FIX: Convert CMYK to RGB if needed
-                        if img_pil.mode == 'CMYK':
-                            img_pil = img_pil.convert('RGB')
-                        elif img_pil.mode not in ('RGB', 'L', 'RGBA'):
-                            img_pil = img_pil.convert('RGB')
+        # Pixels of every probe column ordered bottom-up: (rows, columns, channels)
+        strip = image[start_row:bottom_row + 1, columns][::-1]
+        strip = strip.reshape(strip.shape[0], len(columns), -1).astype(np.int64)
 
-                        # Detect image format
-                        img_format = img_pil.format.lower() if img_pil.format else 'jpg'
-                        if img_format == 'jpeg':
-                            img_format = 'jpg'
+        # Running mean of the pixels below each row; sums of uint8 values stay exact
+        running_sums = np.cumsum(strip, axis=0)[:-1]
+        sample_counts = np.arange(1, strip.shape[0], dtype=np.float64)[:, None, None]
+        running_means = running_sums / sample_counts
 
-                        img_np = np.array(img_pil)
+        max_allowed_diff = 255 * 0.02
+        mismatched = np.any(np.abs(strip[1:] - running_means) > max_allowed_diff, axis=2)
 
-                        if len(img_np.shape) == 2:
-                            img_cv = cv2.cvtColor(img_np, cv2.COLOR_GRAY2BGR)
-                        elif len(img_np.shape) == 3:
-                            if img_np.shape[2] == 4:
-                                img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGBA2BGR)
-                            elif img_np.shape[2] == 3:
-                                img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-                            else:
-                                img_cv = img_np
-                        else:
-                            return None, None, "Invalid image format"
+        has_mismatch = mismatched.any(axis=0)
+        first_mismatch = mismatched.argmax(axis=0) + 1 if mismatched.size else np.zeros(len(columns), dtype=np.int64)
 
-                        return img_cv, img_format, exif_data, "Retrieved from Wayback Machine"
+        column_heights = {}
+        for i, col in enumerate(columns):
+            if has_mismatch[i]:
+                y = bottom_row - int(first_mismatch[i])
+                column_heights[col] = height - 1 - y
+            else:
+                column_heights[col] = height - 1 - start_row
 
-                    except Exception as wb_e:
-                        return None, None, None, f"404 error - Wayback Machine also failed: {str(wb_e)}"
-                else:
-                    return None, None, None, f"404 error - {wayback_error}"
-            return None, None, None, f"Download failed: {str(e)}"
-        except Exception as e:
-            return None, None, None, f"Image processing error: {str(e)}"
+        return column_heights
 
     def find_white_separator(self, image):
         """Find separator by scanning vertical columns and horizontal lines"""
@@ -496,38 +1205,7 @@ class ImageProcessor:
         last_columns = list(range(width-5, width-1))
         all_columns = first_columns + last_columns
 
-        column_heights = {}
-        column_colors = {}
-
-        for col in all_columns:
-            column_height = -1
-            color_samples = []
-
-            for y in range(height-6, start_row-1, -1):
-                pixel = image[y, col]
-
-                if len(color_samples) == 0:
-                    color_samples.append(pixel)
-                    column_height = y
-                else:
-                    avg_color = np.mean(color_samples, axis=0)
-                    color_diff = np.abs(pixel.astype(np.float32) - avg_color)
-                    max_allowed_diff = 255 * 0.02
-                    is_matching = np.all(color_diff <= max_allowed_diff)
-
-                    if is_matching:
-                        color_samples.append(pixel)
-                        column_height = y
-                    else:
-                        if len(color_samples) > 0:
-                            column_heights[col] = height - 1 - y
-                            column_colors[col] = np.mean(color_samples, axis=0)
-                        break
-
-            if column_height != -1 and col not in column_heights:
-                column_heights[col] = height - 1 - start_row
-                if len(color_samples) > 0:
-                    column_colors[col] = np.mean(color_samples, axis=0)
+        column_heights = self.measure_uniform_columns(image, all_columns, start_row)
 
         if not column_heights:
             return -1, False
@@ -594,114 +1272,95 @@ class ImageProcessor:
         """Fallback method to find separator"""
         height, width = image.shape[:2]
 
-        fallback_consecutive_similar_lines = 0
         fallback_separator_row = -1
 
         fallback_required_lines = round((4 / math.log(3100 / 670)) * math.log(height / 670) + 5)
         if fallback_required_lines <= 1:
             fallback_required_lines = 2
 
-        white_color = np.array([255, 255, 255], dtype=np.uint8)
-        fbf9fa_color = np.array([250, 249, 251], dtype=np.uint8)
-        color_tolerance = 255 * 0.02
+        if start_row >= height:
+            return fallback_separator_row
 
-        for y_fallback in range(start_row, height):
-            row_fallback = image[y_fallback]
+        # Per-row background fractions for the whole bottom band at once
+        band_mask = self.background_mask(image[start_row:height])
+        matching_rows = (np.count_nonzero(band_mask, axis=1) / width) >= 0.98
 
-            white_diff = np.abs(row_fallback.astype(np.float32) - white_color.astype(np.float32))
-            white_matching = np.all(white_diff <= color_tolerance, axis=1)
+        # First window of fallback_required_lines consecutive matching rows
+        run_counts = np.concatenate(([0], np.cumsum(matching_rows)))
+        window_counts = run_counts[fallback_required_lines:] - run_counts[:-fallback_required_lines]
+        full_windows = np.flatnonzero(window_counts == fallback_required_lines)
 
-            fbf9fa_diff = np.abs(row_fallback.astype(np.float32) - fbf9fa_color.astype(np.float32))
-            fbf9fa_matching = np.all(fbf9fa_diff <= color_tolerance, axis=1)
+        if full_windows.size:
+            fallback_consecutive_similar_lines = fallback_required_lines
+            y_fallback = start_row + int(full_windows[0]) + fallback_required_lines - 1
 
-            matching_pixels = white_matching | fbf9fa_matching
-            matching_percentage = np.sum(matching_pixels) / width
-
-            if matching_percentage >= 0.98:
-                fallback_consecutive_similar_lines += 1
-                if fallback_consecutive_similar_lines >= fallback_required_lines:
-                    if fallback_consecutive_similar_lines >= 10:
-                        fallback_separator_row_y_offset = fallback_consecutive_similar_lines + 5
-                    elif fallback_consecutive_similar_lines in (1, 2, 3):
-                        fallback_separator_row_y_offset = 2
-                    else:
-                        fallback_separator_row_y_offset = fallback_consecutive_similar_lines + 5
-
-                    fallback_separator_row = y_fallback - fallback_separator_row_y_offset
-                    break
+            if fallback_consecutive_similar_lines >= 10:
+                fallback_separator_row_y_offset = fallback_consecutive_similar_lines + 5
+            elif fallback_consecutive_similar_lines in (1, 2, 3):
+                fallback_separator_row_y_offset = 2
             else:
-                fallback_consecutive_similar_lines = 0
+                fallback_separator_row_y_offset = fallback_consecutive_similar_lines + 5
+
+            fallback_separator_row = y_fallback - fallback_separator_row_y_offset
 
         return fallback_separator_row
 
-    def crop_side_whitespace(self, image):
-        """Crop white or fbf9fa colored sections from left and right sides"""
+    def background_mask(self, image):
+        """Mark pixels matching white or fbf9fa within tolerance in a single pass"""
+        mask = None
+        for color in self.BACKGROUND_COLORS:
+            color = np.array(color, dtype=np.float64)
+            # Integer channel bounds equivalent to |pixel - color| <= tolerance
+            lower = np.clip(np.ceil(color - self.COLOR_TOLERANCE), 0, 255).astype(np.uint8)
+            upper = np.clip(np.floor(color + self.COLOR_TOLERANCE), 0, 255).astype(np.uint8)
+            matching = cv2.inRange(image, lower, upper)
+            mask = matching if mask is None else cv2.bitwise_or(mask, matching)
+        return mask
+
+    def side_crop_bounds(self, image):
+        """Column range (left, right) kept after cropping white or fbf9fa colored sides"""
         height, width = image.shape[:2]
 
-        white_color = np.array([255, 255, 255], dtype=np.uint8)
-        fbf9fa_color = np.array([250, 249, 251], dtype=np.uint8)
-        color_tolerance = 255 * 0.02
-
-        left_crop = 0
-        for x in range(width):
-            column = image[:, x]
+        mask = self.background_mask(image)
+        matching_percentage = np.count_nonzero(mask, axis=0) / height
+        background_columns = matching_percentage >= 0.98
 
-            white_diff = np.abs(column.astype(np.float32) - white_color.astype(np.float32))
-            white_matching = np.all(white_diff <= color_tolerance, axis=1)
-
-            fbf9fa_diff = np.abs(column.astype(np.float32) - fbf9fa_color.astype(np.float32))
-            fbf9fa_matching = np.all(fbf9fa_diff <= color_tolerance, axis=1)
-
-            matching_pixels = white_matching | fbf9fa_matching
-            matching_percentage = np.sum(matching_pixels) / height
-
-            if matching_percentage >= 0.98:
-                left_crop = x + 1
-            else:
-                break
-
-        right_crop = width
-        for x in range(width-1, -1, -1):
-            column = image[:, x]
-
-            white_diff = np.abs(column.astype(np.float32) - white_color.astype(np.float32))
-            white_matching = np.all(white_diff <= color_tolerance, axis=1)
-
-            fbf9fa_diff = np.abs(column.astype(np.float32) - fbf9fa_color.astype(np.float32))
-            fbf9fa_matching = np.all(fbf9fa_diff <= color_tolerance, axis=1)
-
-            matching_pixels = white_matching | fbf9fa_matching
-            matching_percentage = np.sum(matching_pixels) / height
-
-            if matching_percentage >= 0.98:
-                right_crop = x
-            else:
-                break
+        if background_columns.all():
+            left_crop = width
+            right_crop = 0
+        else:
+            left_crop = int(np.argmin(background_columns))
+            right_crop = width - int(np.argmin(background_columns[::-1]))
 
         expansion = int(round((4 / math.log(3100 / 670)) * math.log(height / 670) + 5))
         left_expanded = max(0, left_crop - expansion)
         right_expanded = min(width, right_crop + expansion)
 
         if left_expanded < right_expanded:
-            return image[:, left_expanded:right_expanded]
+            return left_expanded, right_expanded
         else:
-            return image
+            return 0, width
+
+    def crop_side_whitespace(self, image):
+        """Crop white or fbf9fa colored sections from left and right sides"""
+        left, right = self.side_crop_bounds(image)
+        return image[:, left:right]
 
     def crop_image_sections(self, image, separator_row, apply_side_crop=False):
-        """Split image into photo section and text section"""
-        if apply_side_crop:
-            image = self.crop_side_whitespace(image)
+        """Split image into photo and text sections; also returns the photo box (left, top, width, height)"""
+        left, right = self.side_crop_bounds(image) if apply_side_crop else (0, image.shape[1])
+        image = image[:, left:right]
 
         if separator_row == -1:
-            return None, image
+            return None, image, None
 
         photo_section = image[:separator_row, :]
         text_section = image[separator_row:, :]
 
         if photo_section is None or photo_section.size == 0 or photo_section.shape[0] < 1:
-            return None, image
+            return None, image, None
 
-        return photo_section, text_section
+        return photo_section, text_section, (left, 0, photo_section.shape[1], photo_section.shape[0])
 
     def clean_ocr_text(self, text):
         """Clean OCR text with find and replace operations"""
@@ -718,40 +1377,98 @@ class ImageProcessor:
 
         return text
 
+    def encode_png(self, image):
+        """PNG-encode an RGB image section for Vision"""
+        return cv2.imencode('.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))[1].tobytes()
+
     @retry_on_failure(max_attempts=10, delay=2)
     def perform_ocr(self, image):
         """Perform OCR on the text section using Google Cloud Vision API"""
         try:
-            _, buffer = cv2.imencode('.png', image)
-            image_bytes = buffer.tobytes()
+            image_bytes = self.encode_png(image)
 
             vision_image = vision.Image(content=image_bytes)
             image_context = vision.ImageContext(language_hints=['bn', 'en'])
 
-            response = self.vision_client.text_detection(
+            response = RATE_LIMITERS['vision'].call(
+                self.vision_client.text_detection,
                 image=vision_image,
                 image_context=image_context
             )
 
-            if response.text_annotations:
-                raw_text = response.text_annotations[0].description
-                normalized = re.sub(r'\s+', ' ', raw_text).strip()
-                cleaned_text = self.clean_ocr_text(normalized)
-
-                return cleaned_text
-            else:
-                return ""
+            return self.ocr_text_from_response(response)
 
         except Exception as e:
             return f"OCR Error: {str(e)}"
 
-    def process_image(self, row_index, image_url):
-        """Process a single image - download, split, OCR"""
+    def ocr_text_from_response(self, response):
+        """Extract normalized, cleaned text from a Vision annotate response"""
+        if response.text_annotations:
+            raw_text = response.text_annotations[0].description
+            normalized = re.sub(r'\s+', ' ', raw_text).strip()
+            return self.clean_ocr_text(normalized)
+        return ""
+
+    def perform_ocr_batch(self, images):
+        """Perform OCR on several images with batched Vision requests, in input order"""
+        encoded = [self.encode_png(image) for image in images]
+        texts = [None] * len(images)
+
+        # Split into requests of at most OCR_BATCH_SIZE images and OCR_BATCH_MAX_BYTES
+        batches = []
+        current, current_bytes = [], 0
+        for i, image_bytes in enumerate(encoded):
+            if current and (len(current) >= OCR_BATCH_SIZE or current_bytes + len(image_bytes) > OCR_BATCH_MAX_BYTES):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(i)
+            current_bytes += len(image_bytes)
+        if current:
+            batches.append(current)
+
+        image_context = vision.ImageContext(language_hints=['bn', 'en'])
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+
+        for batch in batches:
+            annotate_requests = [
+                vision.AnnotateImageRequest(
+                    image=vision.Image(content=encoded[i]),
+                    features=[feature],
+                    image_context=image_context,
+                )
+                for i in batch
+            ]
+            try:
+                print(f"Sending batched OCR request with {len(batch)} images...")
+                response = RATE_LIMITERS['vision'].call(
+                    self.vision_client.batch_annotate_images, requests=annotate_requests
+                )
+                for i, item in zip(batch, response.responses):
+                    if item.error.message:
+                        print(f"Batched OCR failed for one image ({item.error.message}), retrying singly")
+                        continue
+                    texts[i] = self.ocr_text_from_response(item)
+            except Exception as e:
+                print(f"Batched OCR request failed: {str(e)}, retrying images singly")
+
+        # Partial failures (and images missing from the response) go through the single-image path
+        for i, text in enumerate(texts):
+            if text is None:
+                texts[i] = self.perform_ocr(images[i])
+
+        return texts
+
+    def segment_image(self, row_index, image_url):
+        """Download an image and split it, leaving the OCR input in result['ocr_input']"""
         result = {
             'image': None,
             'format': 'jpg',
             'exif': None,
+            'source': None,
+            'photo_box': None,
             'ocr_text': '',
+            'ocr_input': None,
+            'full_image': False,
             'status': ''
         }
 
@@ -761,7 +1478,7 @@ class ImageProcessor:
                 return result
 
             print(f"Row {row_index}: Downloading image...")
-            image, img_format, exif_data, error = self.download_image(image_url)
+            image, img_format, exif_data, source, error = self.download_image(image_url)
             if error:
                 if "404" in error:
                     result['status'] = error
@@ -773,48 +1490,297 @@ class ImageProcessor:
 
             result['format'] = img_format
             result['exif'] = exif_data
+            result['source'] = source
 
             print(f"Row {row_index}: Finding separator...")
             separator_row, fallback_used = self.find_white_separator(image)
 
-            photo_section, text_section = self.crop_image_sections(image, separator_row, apply_side_crop=fallback_used)
+            photo_section, text_section, photo_box = self.crop_image_sections(
+                image, separator_row, apply_side_crop=fallback_used
+            )
 
             if photo_section is None or separator_row == -1:
                 result['status'] = 'No separator found - using full image'
                 result['image'] = image
-
-                print(f"Row {row_index}: Performing OCR on full image...")
-                ocr_text = self.perform_ocr(image)
-                result['ocr_text'] = ocr_text
-
-                if ocr_text.startswith("OCR Error"):
-                    result['status'] = 'OCR failed'
-                elif not ocr_text:
-                    result['status'] = 'No text detected'
-                else:
-                    result['status'] = 'Success - full image'
+                result['photo_box'] = (0, 0, image.shape[1], image.shape[0])
+                result['ocr_input'] = image
+                result['full_image'] = True
             else:
                 result['image'] = photo_section
-
-                print(f"Row {row_index}: Performing OCR...")
-                ocr_text = self.perform_ocr(text_section)
-                result['ocr_text'] = ocr_text
-
-                if ocr_text.startswith("OCR Error"):
-                    result['status'] = 'OCR failed'
-                elif not ocr_text:
-                    result['status'] = 'No text detected'
-                else:
-                    result['status'] = 'Success'
-
-            print(f"Row {row_index}: Image processing completed")
+                result['photo_box'] = photo_box
+                result['ocr_input'] = text_section
 
         except Exception as e:
             result['status'] = f"Error: {str(e)}"
+            result['image'] = None
+            result['ocr_input'] = None
             print(f"Row {row_index}: Error - {str(e)}")
 
         return result
 
+    def apply_ocr_text(self, result, ocr_text):
+        """Store OCR text in a segmented result and derive its status"""
+        result['ocr_text'] = ocr_text
+        result['ocr_input'] = None
+
+        if ocr_text.startswith("OCR Error"):
+            result['status'] = 'OCR failed'
+        elif not ocr_text:
+            result['status'] = 'No text detected'
+        else:
+            result['status'] = 'Success - full image' if result['full_image'] else 'Success'
+
+    def process_image(self, row_index, image_url, known_ocr_text=None):
+        """Process a single image - download, split, OCR (skipped when known_ocr_text is given)"""
+        result = self.segment_image(row_index, image_url)
+        if result['ocr_input'] is None:
+            return result
+
+        if known_ocr_text is not None:
+            print(f"Row {row_index}: Reusing OCR text from previous run")
+            ocr_text = known_ocr_text
+        elif result['full_image']:
+            print(f"Row {row_index}: Performing OCR on full image...")
+            ocr_text = self.perform_ocr(result['ocr_input'])
+        else:
+            print(f"Row {row_index}: Performing OCR...")
+            ocr_text = self.perform_ocr(result['ocr_input'])
+
+        self.apply_ocr_text(result, ocr_text)
+        print(f"Row {row_index}: Image processing completed")
+        return result
+
+# ============================================================================
+# PHOTO DUPLICATE INDEX
+# ============================================================================
+
+# Set bits of every byte value, for Hamming distances over uint64 hashes
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of an RGB image"""
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+class PhotoHashIndex:
+    """Perceptual hashes of uploaded photos, kept in SQLite and matched in memory
+
+    Rows of the current run claim their hash when they are segmented, so a
+    second copy of the same photo in one run is caught as well. Claims are
+    released if the row fails and made permanent once it is uploaded.
+
+    A hash match only counts if the aspect ratios agree too. Rows skipped as
+    copies of an uploaded photo are remembered by URL so later runs skip them
+    without downloading; URLs listed in the overrides file are never skipped.
+    """
+
+    def __init__(self, path=PHOTO_INDEX_FILE, max_distance=DUPLICATE_MAX_DISTANCE,
+                 max_aspect_diff=DUPLICATE_MAX_ASPECT_DIFF, overrides_path=DUPLICATE_OVERRIDES_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_distance = max_distance
+        self.max_aspect_diff = max_aspect_diff
+        self._lock = threading.Lock()
+        self._claims = {}  # unique_id -> (hash, aspect, label) of rows in flight
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS photos (unique_id TEXT PRIMARY KEY, hash INTEGER, title TEXT, added TEXT)'
+        )
+        if 'aspect' not in [row[1] for row in self.conn.execute('PRAGMA table_info(photos)')]:
+            self.conn.execute('ALTER TABLE photos ADD COLUMN aspect REAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS skipped (url TEXT PRIMARY KEY, duplicate_of TEXT, added TEXT)')
+        self.conn.commit()
+
+        rows = self.conn.execute('SELECT hash, aspect, title FROM photos').fetchall()
+        # SQLite integers are signed; the int64 values are reinterpreted as the unsigned hashes
+        self._hashes = np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64)
+        # Photos indexed before aspect ratios were stored match on the hash alone
+        self._aspects = np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=np.float64)
+        self._labels = [f"File:{row[2]}" for row in rows]
+
+        self.overrides = self._load_overrides(overrides_path)
+        if self.overrides:
+            self.conn.executemany('DELETE FROM skipped WHERE url = ?', [(url,) for url in self.overrides])
+            self.conn.commit()
+
+    @staticmethod
+    def _load_overrides(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return {normalize_url(line.strip()) for line in f if line.strip() and not line.startswith('#')}
+        except FileNotFoundError:
+            return set()
+
+    def __len__(self):
+        return len(self._labels)
+
+    def _match(self, hashes, aspects, photo_hash, aspect):
+        """Index of the closest hash within max_distance whose aspect ratio agrees, or None"""
+        if not len(hashes):
+            return None
+        xor = np.bitwise_xor(hashes, np.uint64(photo_hash))
+        distances = POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            aspect_diff = np.abs(aspects - aspect) / np.maximum(aspects, aspect)
+            same_shape = np.isnan(aspects) | (aspect_diff <= self.max_aspect_diff)
+        candidates = np.flatnonzero((distances <= self.max_distance) & same_shape)
+        if not len(candidates):
+            return None
+        return int(candidates[np.argmin(distances[candidates])])
+
+    def overridden(self, url):
+        return normalize_url(url) in self.overrides
+
+    def skipped_duplicate(self, url):
+        """Label of the uploaded photo an earlier run found this URL to duplicate, or None"""
+        with self._lock:
+            row = self.conn.execute('SELECT duplicate_of FROM skipped WHERE url = ?', (normalize_url(url),)).fetchone()
+        return row[0] if row else None
+
+    def record_skipped(self, url, duplicate_of):
+        """Remember that url duplicates a photo on Commons so later runs skip it"""
+        with self._lock:
+            self._record_skipped(url, duplicate_of)
+
+    def _record_skipped(self, url, duplicate_of):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO skipped (url, duplicate_of, added) VALUES (?, ?, ?)',
+            (normalize_url(url), duplicate_of, datetime.now().isoformat())
+        )
+        self.conn.commit()
+
+    def skipped_urls(self):
+        """Normalized URLs of every row skipped as a duplicate"""
+        with self._lock:
+            return {row[0] for row in self.conn.execute('SELECT url FROM skipped')}
+
+    def claim(self, unique_id, photo_hash, aspect, label, url=None):
+        """Return the label of a matching known photo, or claim photo_hash for this row and return None
+
+        Matches against uploaded photos are remembered for url; URLs in the
+        overrides file claim without matching.
+        """
+        with self._lock:
+            if url is None or normalize_url(url) not in self.overrides:
+                i = self._match(self._hashes, self._aspects, photo_hash, aspect)
+                if i is not None:
+                    if url is not None:
+                        self._record_skipped(url, self._labels[i])
+                    return self._labels[i]
+
+                others = [(h, a, l) for uid, (h, a, l) in self._claims.items() if uid != unique_id]
+                i = self._match(
+                    np.array([h for h, _, _ in others], dtype=np.uint64),
+                    np.array([a for _, a, _ in others], dtype=np.float64), photo_hash, aspect
+                )
+                if i is not None:
+                    return others[i][2]
+
+            self._claims[unique_id] = (photo_hash, aspect, label)
+            return None
+
+    def release(self, unique_id):
+        with self._lock:
+            self._claims.pop(unique_id, None)
+
+    def mark_uploaded(self, unique_id, title):
+        """Make a row's claim permanent under its Commons filename"""
+        with self._lock:
+            claim = self._claims.pop(unique_id, None)
+            if claim is None:
+                return
+            photo_hash, aspect, _ = claim
+            self.conn.execute(
+                'INSERT OR REPLACE INTO photos (unique_id, hash, title, added, aspect) VALUES (?, ?, ?, ?, ?)',
+                (unique_id, photo_hash - (1 << 64) if photo_hash >= 1 << 63 else photo_hash, title,
+                 datetime.now().isoformat(), aspect)
+            )
+            self.conn.commit()
+            self._hashes = np.append(self._hashes, np.uint64(photo_hash))
+            self._aspects = np.append(self._aspects, aspect)
+            self._labels.append(f"File:{title}")
+
+# ============================================================================
+# LLM RESPONSE CACHE
+# ============================================================================
+
+def prompt_version(*prompts):
+    """Short hash identifying the prompt templates an output was produced with"""
+    return hashlib.sha256('\0'.join(prompts).encode('utf-8')).hexdigest()[:16]
+
+class LLMCache:
+    """Persistent cache of Gemini translations and titles keyed by content hash
+
+    Keys hash the whitespace-normalized input text, the prompt version and the
+    model. Entries written under older prompt templates are dropped on open, and
+    the least recently used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, path=LLM_CACHE_FILE, max_entries=LLM_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.versions = {
+            'translation': prompt_version(TRANSLATION_PROMPT, BATCH_TRANSLATION_PROMPT, DESCRIBE_PROMPT),
+            'title': prompt_version(TITLE_PROMPT, DESCRIBE_PROMPT),
+        }
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, kind TEXT, prompt_version TEXT, '
+            'model TEXT, value TEXT, last_used REAL)'
+        )
+        for kind, version in self.versions.items():
+            deleted = self.conn.execute(
+                'DELETE FROM entries WHERE kind = ? AND prompt_version != ?', (kind, version)
+            ).rowcount
+            if deleted:
+                print(f"LLM cache: dropped {deleted} {kind} entries from older prompts")
+        self.conn.commit()
+
+    def _key(self, kind, model, text):
+        normalized = re.sub(r'\s+', ' ', text).strip()
+        return hashlib.sha256('\0'.join([kind, self.versions[kind], model, normalized]).encode('utf-8')).hexdigest()
+
+    def get(self, kind, text, models=(PRIMARY_MODEL, FALLBACK_MODEL)):
+        """Return (value, model) of the first model with a cached output, or (None, None)"""
+        with self._lock:
+            for model in models:
+                key = self._key(kind, model, text)
+                row = self.conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+                if row:
+                    self.conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+                    self.conn.commit()
+                    self.hits += 1
+                    return row[0], model
+            self.misses += 1
+        return None, None
+
+    def put(self, kind, text, model, value):
+        """Store a model output and evict the least recently used entries over the limit"""
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries (key, kind, prompt_version, model, value, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+                (self._key(kind, model, text), kind, self.versions[kind], model, value, time.time())
+            )
+            excess = self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)', (excess,)
+                )
+            self.conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
 # ============================================================================
 # TRANSLATION FUNCTIONS
 # ============================================================================
@@ -831,7 +1797,9 @@ def contains_bengali(text):
 def google_translate(translate_client, text):
     """Translate Bengali text to English using Google Translate API"""
     try:
-        result = translate_client.translate(text, source_language='bn', target_language='en')
+        result = RATE_LIMITERS['translate'].call(
+            translate_client.translate, text, source_language='bn', target_language='en'
+        )
         return result['translatedText']
     except Exception as e:
         print(f"Google Translate error: {e}")
@@ -842,6 +1810,12 @@ def translate_text(genai_client, translate_client, text, row_index):
     if not text.strip():
         return "", "EmptyText"
 
+    if LLM_CACHE:
+        cached, cached_model = LLM_CACHE.get('translation', text)
+        if cached:
+            print(f"Row {row_index}: Using cached translation from {cached_model}")
+            return cached, "Success"
+
     prompt = TRANSLATION_PROMPT.format(text=text.replace('"', "'"))
 
     for model_name in [PRIMARY_MODEL, FALLBACK_MODEL]:
@@ -856,15 +1830,14 @@ def translate_text(genai_client, translate_client, text, row_index):
                     "max_output_tokens": 8192,
                 }
 
-                resp = genai_client.models.generate_content(
+                resp = RATE_LIMITERS['gemini'].call(
+                    genai_client.models.generate_content,
                     model=model_name,
                     contents=prompt,
                     config=generation_config
                 )
-                sleep(2)
 
                 print(f"Row {row_index}: Received translation response from {model_name}")
-                sleep(1)
 
                 if hasattr(resp, "text"):
                     translated = resp.text.strip()
@@ -880,9 +1853,10 @@ def translate_text(genai_client, translate_client, text, row_index):
                     gt_result = google_translate(translate_client, translated)
                     if gt_result:
                         translated = gt_result
-                        sleep(1)
 
                 print(f"Row {row_index}: Translated with {model_name}")
+                if LLM_CACHE:
+                    LLM_CACHE.put('translation', text, model_name, translated)
                 return translated, "Success"
 
 
@@ -896,14 +1870,106 @@ def translate_text(genai_client, translate_client, text, row_index):
 
     return "", "Error: All models failed"
 
+def parse_batch_response(text, field):
+    """Parse a structured batch response into {id: value}"""
+    items = json.loads(text)
+    if not isinstance(items, list):
+        raise ValueError("Batch response is not a JSON list")
+    return {
+        str(item['id']): item.get(field)
+        for item in items
+        if isinstance(item, dict) and 'id' in item
+    }
+
+def translate_batch(genai_client, translate_client, items):
+    """Translate several Bengali texts with one structured Gemini request
+
+    items is a list of (row_index, text). Returns {row_index: (translation, status)}.
+    Items missing from the response, empty or still containing Bengali are
+    translated again one by one with translate_text.
+    """
+    results = {}
+    pending = {}
+    for row_index, text in items:
+        if not text.strip():
+            results[row_index] = ("", "EmptyText")
+            continue
+
+        cached, cached_model = LLM_CACHE.get('translation', text) if LLM_CACHE else (None, None)
+        if cached:
+            print(f"Row {row_index}: Using cached translation from {cached_model}")
+            results[row_index] = (cached, "Success")
+        else:
+            pending[str(row_index)] = (row_index, text)
+
+    if len(pending) > 1:
+        payload = json.dumps([{'id': key, 'text': text} for key, (_, text) in pending.items()], ensure_ascii=False)
+        prompt = BATCH_TRANSLATION_PROMPT.format(items=payload)
+        rows_label = ', '.join(pending)
+        translations = None
+        used_model = None
+
+        for model_name in [PRIMARY_MODEL, FALLBACK_MODEL]:
+            for attempt in range(1, STRUCTURED_REQUEST_ATTEMPTS + 1):
+                try:
+                    print(f"Rows {rows_label}: Sending batched translation request to {model_name}...")
+
+                    generation_config = {
+                        "temperature": 1.0,
+                        "top_p": 0.95,
+                        "max_output_tokens": 8192,
+                        "response_mime_type": "application/json",
+                        "response_schema": TRANSLATION_RESPONSE_SCHEMA,
+                    }
+
+                    resp = RATE_LIMITERS['gemini'].call(
+                        genai_client.models.generate_content,
+                        model=model_name,
+                        contents=prompt,
+                        config=generation_config
+                    )
+
+                    if hasattr(resp, "text"):
+                        response_text = resp.text
+                    else:
+                        response_text = resp.candidates[0].content.parts[0].text
+
+                    translations = parse_batch_response(response_text, 'translation')
+                    used_model = model_name
+                    print(f"Rows {rows_label}: Received batched translation from {model_name}")
+                    break
+
+                except Exception as e:
+                    print(f"Rows {rows_label}: {model_name} batched translation attempt {attempt} failed: {e}")
+
+            if translations is not None:
+                break
+
+        for key, translated in (translations or {}).items():
+            if key not in pending:
+                continue
+            translated = (translated or "").strip()
+            if translated and not contains_bengali(translated):
+                row_index, text = pending.pop(key)
+                results[row_index] = (translated, "Success")
+                print(f"Row {row_index}: Translated in batch")
+                if LLM_CACHE:
+                    LLM_CACHE.put('translation', text, used_model, translated)
+
+    # Re-queue only what the batch could not deliver cleanly
+    for row_index, text in pending.values():
+        results[row_index] = translate_text(genai_client, translate_client, text, row_index)
+
+    return results
+
 # ============================================================================
 # TITLE GENERATION FUNCTIONS
 # ============================================================================
 
 def check_internet():
-    """Check if internet is available"""
+    """Check if internet is available (probe used by the connectivity monitor)"""
     try:
-        requests.get("https://www.google.com", timeout=5)
+        HTTP.get("https://www.google.com", check_connectivity=False)
         return True
     except:
         return False
@@ -937,13 +2003,31 @@ def replace_date_if_needed(title, col_b_date_str):
 
     return title
 
-def generate_title(genai_client, description, date_str, row_index, img_format='jpg'):
-    """Generate Wikimedia Commons compliant filename"""
-    text = f"{description} {date_str}".strip()
+def finish_title(title, date_str, row_index, model, img_format='jpg'):
+    """Correct the date in a generated title and append the file extension"""
+    title = replace_date_if_needed(title, date_str)
+
+    print(f"Row {row_index}: Title generated with {model} (without extension): {title}")
+
+    # Add extension at the very end
+    title = title + '.' + img_format
+
+    print(f"Row {row_index}: Final title (with extension): {title}")
+    return title
+
+def generate_title(genai_client, description, date_str, row_index, img_format='jpg'):
+    """Generate Wikimedia Commons compliant filename"""
+    text = f"{description} {date_str}".strip()
 
     if not text.strip():
         return "", "EmptyText"
 
+    if LLM_CACHE:
+        cached, cached_model = LLM_CACHE.get('title', text)
+        if cached:
+            print(f"Row {row_index}: Using cached title from {cached_model}")
+            return finish_title(cached, date_str, row_index, cached_model, img_format), "Success"
+
     prompt = TITLE_PROMPT.format(text=text.replace('"',"'"))
 
     models_to_try = [PRIMARY_MODEL, FALLBACK_MODEL]
@@ -953,10 +2037,6 @@ def generate_title(genai_client, description, date_str, row_index, img_format='j
         backoff = INITIAL_BACKOFF
 
         for attempt in range(1, MAX_RETRIES + 1):
-            while not check_internet():
-                print(f"Row {row_index}: Waiting for internet connection...")
-                sleep(5)
-
             try:
                 print(f"Row {row_index}: Sending request to {model}...")
 
@@ -967,15 +2047,14 @@ def generate_title(genai_client, description, date_str, row_index, img_format='j
                     "max_output_tokens": 2048,
                 }
 
-                resp = genai_client.models.generate_content(
+                resp = RATE_LIMITERS['gemini'].call(
+                    genai_client.models.generate_content,
                     model=model,
                     contents=prompt,
                     config=generation_config
                 )
-                sleep(2)
 
                 print(f"Row {row_index}: Received response from {model}")
-                sleep(1)
 
                 if hasattr(resp, "text"):
                     title = resp.text.strip()
@@ -997,15 +2076,10 @@ def generate_title(genai_client, description, date_str, row_index, img_format='j
                     else:
                         raise RuntimeError(f"Title exceeds 240 bytes after {MAX_RETRIES} attempts")
 
-                title = replace_date_if_needed(title, date_str)
-
-                print(f"Row {row_index}: Title generated with {model} (without extension): {title}")
+                if LLM_CACHE:
+                    LLM_CACHE.put('title', text, model, title)
 
-                # Add extension at the very end
-                title = title + '.' + img_format
-
-                print(f"Row {row_index}: Final title (with extension): {title}")
-                sleep(2)
+                title = finish_title(title, date_str, row_index, model, img_format)
                 return title, "Success"
 
             except Exception as e:
@@ -1028,6 +2102,95 @@ def generate_title(genai_client, description, date_str, row_index, img_format='j
     print(f"Row {row_index}: Failed all models: {last_exception}")
     return "", f"Error:{repr(last_exception)}"
 
+def describe_image(genai_client, translate_client, text, date_str, row_index, img_format='jpg'):
+    """Translate OCR text and generate its filename with one structured Gemini request
+
+    Returns (translation, trans_status, title, title_status). The usual checks
+    still apply: Bengali in the translation goes through Google Translate, and a
+    missing, Bengali or over-long title is regenerated with generate_title. If
+    the fused request fails, translate_text and generate_title are used instead.
+    """
+    if not text.strip():
+        return "", "EmptyText", "", ""
+
+    cached, cached_model = LLM_CACHE.get('translation', text) if LLM_CACHE else (None, None)
+    if cached:
+        print(f"Row {row_index}: Using cached translation from {cached_model}")
+        title, title_status = generate_title(genai_client, cached, date_str, row_index, img_format)
+        return cached, "Success", title, title_status
+
+    prompt = DESCRIBE_PROMPT.format(text=text.replace('"', "'"), date=date_str)
+    translation, title, used_model = "", "", None
+
+    for model_name in [PRIMARY_MODEL, FALLBACK_MODEL]:
+        for attempt in range(1, STRUCTURED_REQUEST_ATTEMPTS + 1):
+            try:
+                print(f"Row {row_index}: Sending fused translation/title request to {model_name}...")
+
+                generation_config = {
+                    "temperature": 1.0,
+                    "top_p": 0.95,
+                    "max_output_tokens": 8192,
+                    "response_mime_type": "application/json",
+                    "response_schema": DESCRIBE_RESPONSE_SCHEMA,
+                }
+
+                resp = RATE_LIMITERS['gemini'].call(
+                    genai_client.models.generate_content,
+                    model=model_name,
+                    contents=prompt,
+                    config=generation_config
+                )
+
+                if hasattr(resp, "text"):
+                    response_text = resp.text
+                else:
+                    response_text = resp.candidates[0].content.parts[0].text
+
+                data = json.loads(response_text)
+                translation = (data.get('translation') or "").strip()
+                title = (data.get('title') or "").strip()
+                if not translation:
+                    raise RuntimeError("Empty translation")
+
+                used_model = model_name
+                print(f"Row {row_index}: Received fused response from {model_name}")
+                break
+
+            except Exception as e:
+                translation, title = "", ""
+                print(f"Row {row_index}: {model_name} fused attempt {attempt} failed: {e}")
+
+        if used_model:
+            break
+
+    if not used_model:
+        print(f"Row {row_index}: Fused request failed, translating and titling separately")
+        translation, trans_status = translate_text(genai_client, translate_client, text, row_index)
+        if trans_status != "Success":
+            return translation, trans_status, "", ""
+        title, title_status = generate_title(genai_client, translation, date_str, row_index, img_format)
+        return translation, trans_status, title, title_status
+
+    if contains_bengali(translation):
+        print(f"Row {row_index}: Bengali detected in Gemini output, using Google Translate")
+        gt_result = google_translate(translate_client, translation)
+        if gt_result:
+            translation = gt_result
+    print(f"Row {row_index}: Translated with {used_model}")
+    if LLM_CACHE:
+        LLM_CACHE.put('translation', text, used_model, translation)
+
+    if not title or contains_bengali(title) or len(title.encode('utf-8')) > 240:
+        print(f"Row {row_index}: Fused title unusable ({len(title.encode('utf-8'))} bytes), generating separately")
+        title, title_status = generate_title(genai_client, translation, date_str, row_index, img_format)
+        return translation, "Success", title, title_status
+
+    if LLM_CACHE:
+        LLM_CACHE.put('title', f"{translation} {date_str}".strip(), used_model, title)
+
+    return translation, "Success", finish_title(title, date_str, row_index, used_model, img_format), "Success"
+
 # ============================================================================
 # PYWIKIBOT UPLOAD FUNCTIONS
 # ============================================================================
@@ -1057,80 +2220,373 @@ def initialize_pywikibot():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return None
 
-def upload_to_commons(site, FilePage, image, target_filename, img_format, exif_data, description, max_attempts=10):
-    """Upload image to Wikimedia Commons"""
-    from pywikibot.exceptions import UploadError
+def upload_exif(exif_data, size):
+    """Source EXIF for an upload of size (width, height): no thumbnail, upright, with the uploaded dimensions
 
-    # Filename should already have correct extension from title generation
-    # No extension checking or modification here - use filename as-is
+    The source thumbnail and pixel dimensions describe the uncropped scan, and
+    the orientation has already been applied to the pixels.
+    """
+    if not exif_data:
+        return None
+    try:
+        exif = Image.Exif()
+        exif.load(exif_data)
+        if 0x0112 in exif:
+            exif[0x0112] = 1
+        exif_ifd = exif.get_ifd(0x8769)
+        if exif_ifd:
+            exif_ifd[0xA002], exif_ifd[0xA003] = size   # PixelXDimension, PixelYDimension
+        # IFD1, which holds the thumbnail, is not written back
+        return exif.tobytes()
+    except Exception as e:
+        logger.warning(f"Dropping unreadable EXIF data: {e}")
+        return None
+
+def insert_jpeg_exif(data, exif_bytes):
+    """JPEG bytes with an EXIF APP1 segment after SOI and any JFIF APP0"""
+    if not exif_bytes or len(exif_bytes) > 0xFFFF - 2:
+        return data
+    position = 2
+    if data[2:4] == b'\xff\xe0':
+        position = 4 + int.from_bytes(data[4:6], 'big')
+    return data[:position] + b'\xff\xe1' + (len(exif_bytes) + 2).to_bytes(2, 'big') + exif_bytes + data[position:]
+
+def crop_jpeg_lossless(source, box):
+    """Cut box (left, top, width, height) out of JPEG bytes with jpegtran, keeping the encoded data
+
+    Returns None when the crop cannot be lossless: jpegtran is missing, the
+    source is not a plain RGB/greyscale JPEG, it was rotated by its EXIF
+    orientation, or the top-left corner is off the MCU grid. Markers other
+    than comments are not copied; the EXIF is rewritten for the cropped size.
+    """
+    if not LOSSLESS_JPEG_CROP or not JPEGTRAN_PATH or not source or box is None:
+        return None
 
-    # Save image temporarily with correct format
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{img_format}')
     try:
-        # Convert OpenCV image back to PIL to preserve EXIF
-        img_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        img_pil = Image.fromarray(img_rgb)
-
-        # Save with EXIF data if available
-        save_kwargs = {}
-        if exif_data:
-            save_kwargs['exif'] = exif_data
-
-        if img_format == 'png':
-            img_pil.save(temp_file.name, 'PNG', optimize=True, **save_kwargs)
-        elif img_format == 'jpg':
-            img_pil.save(temp_file.name, 'JPEG', quality=95, **save_kwargs)
-        else:
-            img_pil.save(temp_file.name, **save_kwargs)
+        with Image.open(BytesIO(source)) as img:
+            # MPO is a JPEG with further images appended, which jpegtran drops
+            if img.format not in ('JPEG', 'MPO') or img.mode not in ('RGB', 'L'):
+                return None
+            if img.getexif().get(0x0112, 1) != 1:
+                return None
+            # MCU size follows the largest chroma sampling factors
+            mcu_width = 8 * max(layer[1] for layer in img.layer)
+            mcu_height = 8 * max(layer[2] for layer in img.layer)
+            full_box = (0, 0) + img.size
+            exif_data = img.info.get('exif')
+    except Exception:
+        return None
 
-        # Try uploading with retries
-        for attempt in range(max_attempts):
-            try:
-                file_page = FilePage(site, f'File:{target_filename}')
+    left, top, width, height = box
+    if left % mcu_width or top % mcu_height:
+        return None
+    if tuple(box) == full_box:
+        return source
+
+    try:
+        proc = subprocess.run(
+            [JPEGTRAN_PATH, '-copy', 'comments', '-crop', f'{width}x{height}+{left}+{top}'],
+            input=source, capture_output=True, timeout=60, check=True
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Lossless JPEG crop failed, re-encoding instead: {e}")
+        return None
+    if not proc.stdout:
+        return None
+    return insert_jpeg_exif(proc.stdout, upload_exif(exif_data, (width, height)))
+
+class UploadStats:
+    """Encoded size, latency and retry waits of the uploads of a run"""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.retries = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, size, seconds):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.seconds += seconds
+            self.slowest = max(self.slowest, seconds)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.retries += 1
+            self.waited += seconds
+
+    def summary(self):
+        # Uploads overlap, so seconds is the summed per-upload latency rather than wall time
+        rate = self.bytes / self.seconds / 1024 / 1024 if self.seconds else 0.0
+        average = self.seconds / self.files if self.files else 0.0
+        return (
+            f"{self.files} files, {self.bytes / 1024 / 1024:.1f} MB, {average:.1f}s average and {self.slowest:.1f}s "
+            f"slowest upload ({rate:.2f} MB/s per upload), {self.retries} retries waiting {self.waited:.0f}s"
+        )
+
+UPLOAD_STATS = UploadStats()
+
+def encode_upload_image(image, img_format, exif_data, source=None, photo_box=None):
+    """Encode the photo section once into the bytes that will be uploaded"""
+    lossless = crop_jpeg_lossless(source, photo_box) if img_format == 'jpg' else None
+    if lossless:
+        return lossless
+
+    # Images are kept as RGB arrays, so PIL can wrap the photo section directly
+    img_pil = Image.fromarray(image)
+    buffer = BytesIO()
+
+    # Save with EXIF data if available
+    save_kwargs = {}
+    exif_data = upload_exif(exif_data, img_pil.size)
+    if exif_data:
+        save_kwargs['exif'] = exif_data
 
-                if file_page.exists():
+    if img_format == 'png':
+        img_pil.save(buffer, 'PNG', optimize=True, **save_kwargs)
+    elif img_format == 'tif':
+        img_pil.save(buffer, 'TIFF', compression='tiff_lzw', **save_kwargs)
+    else:
+        img_pil.save(buffer, 'JPEG', quality=95, **save_kwargs)
+
+    return buffer.getvalue()
+
+def upload_mime_type(img_format):
+    """MIME type of the bytes encode_upload_image produces for img_format"""
+    pil_format = Image.registered_extensions().get(f'.{img_format}')
+    if UPLOAD_FORMATS.get(pil_format) != img_format:
+        return 'image/jpeg'
+    return Image.MIME[pil_format]
+
+UPLOAD_REQUEST = None
+
+def upload_request_class():
+    """pywikibot Request subclass that keeps the retry hints of its own last response
+
+    pywikibot records Retry-After on the site throttle, which all upload threads
+    share, so each request keeps its own copy for the retry decision.
+    """
+    global UPLOAD_REQUEST
+    if UPLOAD_REQUEST is None:
+        from pywikibot.data.api import Request
+
+        class UploadRequest(Request):
+            retry_after = 0.0
+            lag = 0.0
+
+            def _http_request(self, *args, **kwargs):
+                response, use_get = super()._http_request(*args, **kwargs)
+                if response is not None:
+                    self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                return response, use_get
+
+            def _json_loads(self, response):
+                result = super()._json_loads(response)
+                error = (result or {}).get('error') or {}
+                if error.get('code') == 'maxlag':
+                    self.lag = float(error.get('lag') or 0)
+                return result
+
+        UPLOAD_REQUEST = UploadRequest
+    return UPLOAD_REQUEST
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header given in seconds; 0 when absent or an HTTP date"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0
+
+def submit_upload(site, params, mime=None):
+    """Submit one upload API request; errors carry the Retry-After and lag of this request's last response
+
+    pywikibot retries ratelimited and maxlag responses itself and raises
+    TimeoutError or MaxlagTimeoutError once it gives up.
+    """
+    from pywikibot.exceptions import APIError, MaxlagTimeoutError, TimeoutError as RetriesExhaustedError
+
+    request = upload_request_class()(site=site, parameters=params, mime=mime)
+    try:
+        return request.submit().get('upload', {})
+    except (APIError, MaxlagTimeoutError, RetriesExhaustedError) as e:
+        e.retry_after = request.retry_after
+        e.lag = request.lag
+        raise
+
+def api_upload(site, filename, data, description, comment=UPLOAD_COMMENT, mime_type='image/jpeg'):
+    """Upload file bytes through the MediaWiki API; files over UPLOAD_CHUNK_SIZE go through the stash in chunks
+
+    Returns the API 'upload' result dictionary.
+    """
+    mime_type = tuple(mime_type.split('/', 1))
+    params = {
+        'action': 'upload',
+        'filename': filename,
+        'comment': comment,
+        'text': description,
+        'token': site.tokens['csrf'],
+    }
+
+    if len(data) <= UPLOAD_CHUNK_SIZE:
+        result = submit_upload(site, params, mime={'file': (data, mime_type, {'filename': filename})})
+        return acknowledge_upload_warnings(site, params, result)
+
+    filekey, offset = None, 0
+    view = memoryview(data)
+    while offset < len(data):
+        chunk_params = {
+            'action': 'upload',
+            'stash': True,
+            'filename': filename,
+            'filesize': len(data),
+            'offset': offset,
+            'token': site.tokens['csrf'],
+        }
+        if filekey:
+            chunk_params['filekey'] = filekey
+
+        chunk = bytes(view[offset:offset + UPLOAD_CHUNK_SIZE])
+        result = submit_upload(
+            site, chunk_params, mime={'chunk': (chunk, ('application', 'octet-stream'), {'filename': filename})}
+        )
+        if result.get('result') not in ('Continue', 'Success'):
+            return result
+
+        filekey = result['filekey']
+        offset = result.get('offset', offset + len(chunk))
+        logger.info(f"Uploaded chunk of {filename}: {offset}/{len(data)} bytes")
+
+    # Publish the assembled file from the stash
+    params['filekey'] = filekey
+    return acknowledge_upload_warnings(site, params, submit_upload(site, params))
+
+def acknowledge_upload_warnings(site, params, result):
+    """Publish a stashed upload whose only warnings are harmless; title and duplicate warnings are returned as-is"""
+    warnings = result.get('warnings') or {}
+    if result.get('result') != 'Warning' or not result.get('filekey'):
+        return result
+    if any(warning in warnings for warning in UPLOAD_TITLE_WARNINGS + UPLOAD_DUPLICATE_WARNINGS):
+        return result
+
+    logger.info(f"Acknowledging upload warnings for {params['filename']}: {', '.join(warnings)}")
+    params = dict(params, filekey=result['filekey'], ignorewarnings=True)
+    return submit_upload(site, params)
+
+def commons_file_sha1(site, FilePage, title):
+    """SHA-1 of the current version of a Commons file; None if missing, '' if the page has no file"""
+    from pywikibot.exceptions import PageRelatedError
+
+    page = FilePage(site, f'File:{title}')
+    if not page.exists():
+        return None
+    try:
+        return page.latest_file_info.sha1
+    except PageRelatedError:
+        return ''
+
+def upload_retry_delay(error, attempt):
+    """Seconds to wait before retrying an upload: the failed request's Retry-After or lag, else exponential backoff"""
+    # submit_upload attaches the hints of the attempt that raised
+    hint = max(getattr(error, 'retry_after', 0), getattr(error, 'lag', 0))
+    if hint > 0:
+        return hint + random.uniform(0, 1)
+
+    return min(UPLOAD_RETRY_WAIT * BACKOFF_MULTIPLIER ** attempt, MAX_BACKOFF) * random.uniform(0.8, 1.2)
+
+def upload_to_commons(site, FilePage, image, target_filename, img_format, exif_data, description, max_attempts=10,
+                      source=None, photo_box=None, check_exists=True):
+    """Upload image to Wikimedia Commons from memory, cropping JPEG sources losslessly when possible
+
+    check_exists=False skips the existence query before the first attempt for
+    titles already checked in bulk by CommonsTitleChecker. Retries always check,
+    and a file that is already there with the same SHA-1 counts as uploaded.
+
+    Returns (uploaded, message). uploaded is None when Commons already has the
+    photo under another title; message then names the existing files.
+    """
+    from pywikibot.exceptions import APIError, MaxlagTimeoutError, TimeoutError as RetriesExhaustedError
+
+    # Filename should already have correct extension from title generation
+    # No extension checking or modification here - use filename as-is
+
+    # Encode once; the same bytes are reused by every retry
+    data = encode_upload_image(image, img_format, exif_data, source=source, photo_box=photo_box)
+    mime_type = upload_mime_type(img_format)
+    sha1 = hashlib.sha1(data).hexdigest()
+    logger.info(f"Encoded {target_filename}: {len(data) / 1024:.0f} KB ({mime_type})")
+
+    # Try uploading with retries
+    for attempt in range(max_attempts):
+        error = None
+        try:
+            # A failed attempt may have stored the file before its response was lost
+            if check_exists or attempt > 0:
+                existing = commons_file_sha1(site, FilePage, target_filename)
+                if existing == sha1:
+                    logger.info(f"{target_filename} is already on Commons with the same content")
+                    return True, ''
+                if existing is not None:
                     logger.info(f"File already exists: {target_filename}")
                     return False, 'File already exists'
 
-                logger.info(f"Uploading {target_filename} (attempt {attempt + 1}/{max_attempts})")
+            logger.info(f"Uploading {target_filename} (attempt {attempt + 1}/{max_attempts})")
 
-                success = file_page.upload(
-                    source=temp_file.name,
-                    comment=f"Pypan 0.1.1a0",
-                    text=description,
-                    ignore_warnings=True,
+            start = time.monotonic()
+            result = api_upload(site, target_filename, data, description, mime_type=mime_type)
+            elapsed = time.monotonic() - start
+
+            if result.get('result') == 'Success':
+                UPLOAD_STATS.record(len(data), elapsed)
+                logger.info(
+                    f"Successfully uploaded {target_filename} ({len(data) / 1024:.0f} KB in {elapsed:.1f}s, "
+                    f"{len(data) / 1024 / 1024 / max(elapsed, 1e-6):.2f} MB/s)"
                 )
+                return True, ''
 
-                if success:
-                    logger.info(f"Successfully uploaded {target_filename}")
+            warnings = result.get('warnings') or {}
+            if any(warning in warnings for warning in UPLOAD_TITLE_WARNINGS):
+                if commons_file_sha1(site, FilePage, target_filename) == sha1:
+                    logger.info(f"{target_filename} is already on Commons with the same content")
                     return True, ''
-                else:
-                    logger.warning(f"Upload failed - server response for {target_filename}")
+                logger.info(f"File already exists: {target_filename}")
+                return False, 'File already exists'
+            duplicates = []
+            for warning in UPLOAD_DUPLICATE_WARNINGS:
+                names = warnings.get(warning) or []
+                duplicates += names if isinstance(names, list) else [names]
+            if duplicates:
+                logger.info(f"{target_filename} duplicates {', '.join(duplicates)}")
+                return None, ', '.join(f"File:{name}" for name in duplicates)
+
+            logger.warning(f"Upload failed - server response for {target_filename}: {result}")
+
+        except (APIError, MaxlagTimeoutError, RetriesExhaustedError) as e:
+            if getattr(e, 'code', None) == 'fileexists-no-change':
+                logger.info(f"{target_filename} is already on Commons with the same content")
+                return True, ''
+            error = e
+            logger.warning(f"Upload warning for {target_filename}: {str(e)}")
 
-            except UploadError as e:
-                logger.warning(f"Upload warning for {target_filename}: {str(e)}")
-
-            except Exception as e:
-                logger.error(f"Error uploading {target_filename}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error uploading {target_filename}: {str(e)}")
 
-            if attempt < max_attempts - 1:
-                logger.info(f"Waiting 10 seconds before retry...")
-                sleep(10)
+        if attempt < max_attempts - 1:
+            delay = upload_retry_delay(error, attempt)
+            UPLOAD_STATS.record_wait(delay)
+            logger.info(f"Waiting {delay:.0f} seconds before retrying {target_filename}...")
+            sleep(delay)
 
-        return False, 'Max attempts reached'
+    return False, 'Max attempts reached'
 
-    finally:
-        # Clean up temp file
-        try:
-            os.unlink(temp_file.name)
-        except:
-            pass
-
-def update_pid_date_data(site, data_entry):
-    """Update the PIDDateData module page with new entry"""
+def update_pid_date_data(site, data_entries, year=None):
+    """Append entries to the PIDDateData module page in a single edit"""
     try:
-        current_year = datetime.now().year
-        page_title = f"Module:PIDDateData/{current_year}"
+        year = year or datetime.now().year
+        page_title = f"Module:PIDDateData/{year}"
 
         import pywikibot
         page = pywikibot.Page(site, page_title)
@@ -1146,13 +2602,20 @@ def update_pid_date_data(site, data_entry):
             logger.error("Could not find closing brace in page")
             return False
 
-        new_entry = f"    {data_entry}\n"
-        updated_text = page_text[:last_brace_index] + new_entry + page_text[last_brace_index:]
+        # Entries saved by an edit whose confirmation was lost are not added twice
+        new_entries = [entry for entry in data_entries if entry.strip() not in page_text]
+        if not new_entries:
+            logger.info(f"{page_title} already contains all {len(data_entries)} entries")
+            return True
+
+        new_text = ''.join(f"    {entry}\n" for entry in new_entries)
+        updated_text = page_text[:last_brace_index] + new_text + page_text[last_brace_index:]
 
         page.text = updated_text
-        page.save(summary="added another image")
+        summary = "added another image" if len(new_entries) == 1 else f"added {len(new_entries)} images"
+        page.save(summary=summary)
 
-        logger.info(f"Successfully updated {page_title}")
+        logger.info(f"Successfully updated {page_title} with {len(new_entries)} entries")
         return True
 
     except Exception as e:
@@ -1161,22 +2624,201 @@ def update_pid_date_data(site, data_entry):
         logger.error(f"Traceback: {traceback.format_exc()}")
         return False
 
-def excel_to_wikitable(df):
-    """Convert pandas DataFrame to wikitable format"""
-    wikitable = '{| class="wikitable sortable"\n'
+class PIDDateDataBuffer:
+    """Write-behind buffer for PIDDateData entries
+
+    Entries are stored durably in SQLite as soon as their upload succeeds and
+    are written to the module in chunks of PID_FLUSH_SIZE, when
+    PID_FLUSH_INTERVAL has passed, or when the run ends. Entries left over by
+    a crash or a failed edit are written by the next flush.
+    """
+
+    def __init__(self, site, index=None, path=PID_PENDING_FILE, chunk_size=PID_FLUSH_SIZE,
+                 interval=PID_FLUSH_INTERVAL):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.site = site
+        self.index = index
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending (url TEXT PRIMARY KEY, unique_id TEXT, entry TEXT, year INTEGER, added TEXT)'
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def add(self, unique_id, image_url, date_str, data_entry):
+        """Buffer one entry; returns the unique IDs committed if this triggered a flush"""
+        year = datetime.now().year
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pending (url, unique_id, entry, year, added) VALUES (?, ?, ?, ?, ?)',
+                (normalize_url(image_url), unique_id, data_entry, year, datetime.now().isoformat())
+            )
+            self.conn.commit()
+            buffered = self.conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+        # The scraper already treats the URL as known
+        if self.index is not None:
+            self.index.add(image_url, date_str, year)
+
+        if buffered >= self.chunk_size or time.monotonic() - self._last_flush >= self.interval:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Write all buffered entries, one edit per chunk; returns the unique IDs committed"""
+        committed = []
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            with self._lock:
+                rows = self.conn.execute('SELECT url, unique_id, entry, year FROM pending ORDER BY added').fetchall()
+
+            by_year = {}
+            for row in rows:
+                by_year.setdefault(row[3], []).append(row)
+
+            for year, entries in by_year.items():
+                for start in range(0, len(entries), self.chunk_size):
+                    chunk = entries[start:start + self.chunk_size]
+                    print(f"Writing {len(chunk)} entries to Module:PIDDateData/{year}...")
+                    entries_text = [entry for _, _, entry, _ in chunk]
+                    if not CONNECTIVITY.wait_until_online() or not update_pid_date_data(self.site, entries_text, year):
+                        print(f"PIDDateData update failed, {len(entries) - start} entries stay buffered")
+                        break
+
+                    with self._lock:
+                        self.conn.executemany('DELETE FROM pending WHERE url = ?', [(url,) for url, _, _, _ in chunk])
+                        self.conn.commit()
+                    committed += [unique_id for _, unique_id, _, _ in chunk]
+
+        return committed
+
+def numbered_title(title, number):
+    """Variant of a filename with ' (number)' before the extension"""
+    base, ext = os.path.splitext(title)
+    return f"{base} ({number}){ext}"
+
+class CommonsTitleChecker:
+    """Bulk existence checks for Commons file titles, with a local cache of taken titles
+
+    Titles are looked up TITLE_CHECK_BATCH_SIZE at a time in one action=query
+    request. Existing titles are cached permanently, and titles handed out in
+    this run are reserved so two rows never get the same name.
+    """
+
+    API_URL = PIDDateIndex.API_URL
+
+    def __init__(self, path=TITLE_CACHE_FILE, api_url=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.api_url = api_url or self.API_URL
+        self._lock = threading.Lock()
+        self._reserved = set()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS existing (title TEXT PRIMARY KEY, checked TEXT)')
+        self.conn.commit()
+        self._known = {row[0] for row in self.conn.execute('SELECT title FROM existing')}
+
+    def _remember(self, titles):
+        with self._lock:
+            self._known.update(titles)
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO existing (title, checked) VALUES (?, ?)',
+                [(title, datetime.now().isoformat(timespec='seconds')) for title in titles]
+            )
+            self.conn.commit()
+
+    def _query(self, titles):
+        """Return the subset of titles that exist on Commons"""
+        existing = set()
+        for start in range(0, len(titles), TITLE_CHECK_BATCH_SIZE):
+            chunk = titles[start:start + TITLE_CHECK_BATCH_SIZE]
+            params = {
+                'action': 'query',
+                'titles': '|'.join(f'File:{title}' for title in chunk),
+                'format': 'json',
+                'formatversion': 2,
+            }
+            response = HTTP.get(self.api_url, params=params, headers={'User-Agent': 'PressInformScraper/1.0 Python/requests'})
+            response.raise_for_status()
+
+            query = response.json().get('query', {})
+            # Map normalized titles (underscores, first letter) back to what was asked
+            asked = {item['to']: item['from'] for item in query.get('normalized', [])}
+            for page in query.get('pages', []):
+                if page.get('missing') or page.get('invalid'):
+                    continue
+                title = asked.get(page['title'], page['title'])
+                existing.add(title.split(':', 1)[1])
+        return existing
+
+    def existing(self, titles):
+        """Return which of the titles are taken on Commons, querying only uncached ones"""
+        titles = list(dict.fromkeys(titles))
+        with self._lock:
+            unknown = [title for title in titles if title not in self._known]
+        if unknown:
+            self._remember(self._query(unknown))
+        with self._lock:
+            return {title for title in titles if title in self._known}
+
+    def assign(self, titles):
+        """Map {key: title} to free titles, numbering taken ones; None when no variant is free"""
+        taken = self.existing([title for title in titles.values() if title])
+        assigned = {}
+        for key, title in titles.items():
+            if not title:
+                assigned[key] = None
+                continue
+
+            candidates = [title]
+            with self._lock:
+                if title in taken or title in self._reserved:
+                    candidates = [numbered_title(title, n) for n in range(2, 2 + TITLE_ALTERNATIVES)]
+            if len(candidates) > 1:
+                taken |= self.existing(candidates)
+
+            with self._lock:
+                free = next((c for c in candidates if c not in taken and c not in self._reserved), None)
+                if free:
+                    self._reserved.add(free)
+            assigned[key] = free
+        return assigned
+
+    def release(self, title):
+        """Give back a reserved title whose row did not upload"""
+        with self._lock:
+            self._reserved.discard(title)
+
+    def mark_uploaded(self, title):
+        self.release(title)
+        self._remember([title])
+
+WIKITABLE_HEADER = '! Unique ID !! Date !! Image URL !! !! OCR Text !! Status !! Translation !! Trans Status !! Title !! Title Status !! Data Entry !! PIDDateData Status !! Description !! Upload Status'
 
-    # Add headers
-    wikitable += '! Unique ID !! Date !! Image URL !! !! OCR Text !! Status !! Translation !! Trans Status !! Title !! Title Status !! Data Entry !! PIDDateData Status !! Description !! Upload Status\n'
+def excel_to_wikitable(df):
+    """Convert pandas DataFrame to wikitable format, collecting lines in one pass over the rows"""
+    lines = ['{| class="wikitable sortable"', WIKITABLE_HEADER]
 
-    # Add rows
-    for idx in range(len(df)):
-        wikitable += '|-\n'
-        for col in range(min(14, df.shape[1])):
-            cell_value = str(df.iat[idx, col]) if pd.notna(df.iat[idx, col]) else ""
+    columns = min(14, df.shape[1])
+    for values in df.iloc[:, :columns].itertuples(index=False, name=None):
+        lines.append('|-')
+        cells = [str(value) if pd.notna(value) else "" for value in values]
 
+        for col, cell_value in enumerate(cells):
             # Special handling for column 0 (Unique ID) - add File link with title from column 8
             if col == 0:
-                title_value = str(df.iat[idx, 8]) if pd.notna(df.iat[idx, 8]) else ""
+                title_value = cells[8] if len(cells) > 8 else ""
                 if title_value:
                     # Add [[File:title]] before the unique ID
                     cell_value = f"[[File:{title_value}|100px]] {cell_value}"
@@ -1196,13 +2838,18 @@ def excel_to_wikitable(df):
                 # Escape wiki markup
                 cell_value = cell_value.replace('|', '{{!}}').replace('\n', '<br>')
 
-            wikitable += f'| {cell_value}\n'
+            lines.append(f'| {cell_value}')
+
+    lines.append('|}')
+    return '\n'.join(lines)
 
-    wikitable += '|}'
-    return wikitable
+def log_to_commons(site, df=None, success_count=0, failed_count=0, total_rows=0, skipped_count=0):
+    """Log processing results to Wikimedia Commons user pages
 
-def log_to_commons(site, df=None, success_count=0, failed_count=0, total_rows=0):
-    """Log processing results to Wikimedia Commons user page"""
+    Each run with images gets its own subpage of the monthly log page; the
+    monthly page only receives a one-line entry, appended without
+    downloading it.
+    """
     try:
         import pywikibot
         from datetime import datetime
@@ -1213,31 +2860,37 @@ def log_to_commons(site, df=None, success_count=0, failed_count=0, total_rows=0)
         year = current_date.strftime("%Y")
         page_title = f"User:PID-Bangladesh-UploadBot/Log/{month_name} {year}"
 
-        page = pywikibot.Page(site, page_title)
-
         # Generate timestamp
         timestamp = current_date.strftime("%Y-%m-%d %H:%M:%S UTC")
 
         if df is None:
             # No new images found
-            log_entry = f"\n\n{timestamp} \nBot run completed. No new images found.\n"
+            index_entry = f"\n* {timestamp}: Bot run completed. No new images found."
         else:
-            # Convert DataFrame to wikitable
-            wikitable = excel_to_wikitable(df)
-
-            # Create log entry
-            log_entry = f"\n\n== {timestamp} ==\n"
-            log_entry += f"Processed {total_rows} images. "
-            log_entry += f"Successful uploads: {success_count}, Failed: {failed_count}\n\n"
-            log_entry += wikitable + "\n"
-
-        # Append to existing page or create new one
-        if page.exists():
-            page.text = page.text + log_entry
-        else:
-            page.text = f"Upload Log for {month_name} {year} =\n" + log_entry
-
-        page.save(summary="Bot log update")
+            run_title = f"{page_title}/{current_date.strftime('%Y-%m-%d %H-%M-%S')}"
+            run_page = pywikibot.Page(site, run_title)
+            summary = (
+                f"Processed {total_rows} images. Successful uploads: {success_count}, Failed: {failed_count}, "
+                f"Skipped duplicates: {skipped_count}"
+            )
+            run_page.text = f"== {timestamp} ==\n{summary}\n\n{excel_to_wikitable(df)}\n"
+            run_page.save(summary="Bot log update")
+            logger.info(f"Saved run log to {run_title}")
+
+            index_entry = f"\n* [[{run_title}|{timestamp}]]: {summary}"
+
+        # Start the monthly page with its heading the first time
+        if not pywikibot.Page(site, page_title).exists():
+            index_entry = f"Upload Log for {month_name} {year} =\n" + index_entry
+
+        site.simple_request(
+            action='edit',
+            title=page_title,
+            appendtext=index_entry,
+            summary="Bot log update",
+            bot=True,
+            token=site.tokens['csrf'],
+        ).submit()
         logger.info(f"Successfully logged to {page_title}")
         return True
 
@@ -1245,6 +2898,109 @@ def log_to_commons(site, df=None, success_count=0, failed_count=0, total_rows=0)
         logger.error(f"Error logging to Commons: {str(e)}")
         return False
 
+# ============================================================================
+# PIPELINE EXECUTOR
+# ============================================================================
+
+_STOP = object()
+
+class StagePipeline:
+    """Run jobs through a chain of stages, each on its own worker pool
+
+    Stages are (name, func, workers) or (name, func, workers, batch_size) tuples
+    connected by bounded queues. func(job) returns True to hand the job to the
+    next stage, False to drop it. Batched stages get a list of up to batch_size
+    jobs and return the list of jobs to hand on.
+    """
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE, on_error=None, batch_wait=PIPELINE_BATCH_WAIT):
+        self.stages = stages
+        self.on_error = on_error
+        self.batch_wait = batch_wait
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._finished = [0] * len(stages)
+        self._lock = threading.Lock()
+
+    def _collect(self, inbox, batch_size):
+        """Take up to batch_size jobs, waiting at most batch_wait after the first one"""
+        first = inbox.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _worker(self, index):
+        name, func, workers = self.stages[index][:3]
+        batched = len(self.stages[index]) > 3
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+
+        stopped = False
+        while not stopped:
+            if batched:
+                batch, stopped = self._collect(inbox, self.stages[index][3])
+                if not batch:
+                    continue
+            else:
+                job = inbox.get()
+                if job is _STOP:
+                    break
+                batch = [job]
+
+            try:
+                if batched:
+                    passed = func(batch)
+                else:
+                    passed = batch if func(batch[0]) else []
+            except Exception as e:
+                logger.error(f"Stage {name} failed: {str(e)}")
+                if self.on_error:
+                    for job in batch:
+                        self.on_error(job, name, e)
+                passed = []
+
+            if outbox is not None:
+                for job in passed:
+                    outbox.put(job)
+
+        # The last worker of a stage shuts down the next stage
+        with self._lock:
+            self._finished[index] += 1
+            last = self._finished[index] == workers
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1][2]):
+                outbox.put(_STOP)
+
+    def run(self, jobs):
+        """Feed jobs through every stage and block until all of them are done"""
+        threads = []
+        for index, (name, _, workers, *_) in enumerate(self.stages):
+            for n in range(workers):
+                thread = threading.Thread(target=self._worker, args=(index,), name=f"{name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        for job in jobs:
+            self.queues[0].put(job)
+        for _ in range(self.stages[0][2]):
+            self.queues[0].put(_STOP)
+
+        for thread in threads:
+            thread.join()
+
 # ============================================================================
 # MAIN PIPELINE
 # ============================================================================
@@ -1320,7 +3076,550 @@ def setup_credentials():
 
     return creds_path
 
+class RunStateStore:
+    """Durable per-row progress of one run, keyed by the row's unique ID"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS cells (unique_id TEXT, field TEXT, value TEXT, PRIMARY KEY (unique_id, field))'
+        )
+        self.conn.commit()
+
+    @classmethod
+    def for_excel(cls, excel_file):
+        """Open the state store that belongs to a scraped spreadsheet"""
+        return cls(os.path.splitext(excel_file)[0] + '.state.sqlite3')
+
+    def set(self, unique_id, values):
+        """Record field values of one row in a single transaction"""
+        with self._lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO cells (unique_id, field, value) VALUES (?, ?, ?)',
+                [(unique_id, field, value) for field, value in values.items()]
+            )
+            self.conn.commit()
+
+    def set_rows(self, rows):
+        """Record {unique_id: {field: value}} for many rows in a single transaction"""
+        with self._lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO cells (unique_id, field, value) VALUES (?, ?, ?)',
+                [(unique_id, field, value) for unique_id, values in rows.items() for field, value in values.items()]
+            )
+            self.conn.commit()
+
+    def rows(self):
+        """Return {unique_id: {field: value}} for every stored row"""
+        rows = {}
+        with self._lock:
+            for unique_id, field, value in self.conn.execute('SELECT unique_id, field, value FROM cells'):
+                rows.setdefault(unique_id, {})[field] = value
+        return rows
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def remove(self):
+        """Close and delete the store once its run has been logged"""
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.unlink(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+def find_previous_states(output_dir=OUTPUT_DIR):
+    """Return state stores of runs that never finished logging, newest first"""
+    pattern = os.path.join(output_dir, 'pressinform_photos_*.state.sqlite3')
+    return sorted(glob.glob(pattern), reverse=True)
+
+def load_resume_data(state_paths):
+    """Merge recorded stage outputs of unfinished runs, keyed by normalized image URL"""
+    resume = {}
+    for path in reversed(state_paths):  # Oldest first so newer runs win
+        try:
+            store = RunStateStore(path)
+            try:
+                for values in store.rows().values():
+                    if values.get('image_url'):
+                        resume.setdefault(normalize_url(values['image_url']), {}).update(values)
+            finally:
+                store.close()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not read previous run state {path}: {e}")
+    return resume
+
+def remove_previous_run(state_path):
+    """Delete a superseded run's state store and spreadsheet"""
+    excel_file = state_path[:-len('.state.sqlite3')] + '.xlsx'
+    for path in (state_path, state_path + '-wal', state_path + '-shm', excel_file):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def build_description(bengali_text, translation, date_str, image_url):
+    """Build the Commons file description page text"""
+    return f'''=={{{{int:filedesc}}}}==
+{{{{Information
+ |description = {{{{bn|1={bengali_text}}}}}{{{{en|1={translation}{{{{Auto-translated PID English description}}}}}}}}
+ |date = {{{{Date-PID|{date_str}}}}}
+ |source = {{{{Source-PID | url={image_url}}}}}
+ |author = {{{{Institution:Press Information Department}}}}
+ |permission =
+ |other versions =
+}}}}
+=={{{{int:license-header}}}}==
+{{{{PD-BDGov-PID}}}}
+[[Category: Uploaded with pypan]]'''
+
+class RowJob:
+    """State of one spreadsheet row while it moves through the pipeline"""
+
+    def __init__(self, idx, unique_id, date_str, image_url):
+        self.idx = idx
+        self.row = idx + 1
+        self.unique_id = unique_id
+        self.date_str = date_str
+        self.image_url = image_url
+        self.result = None
+        self.translation = ""
+        self.title = ""
+        self.outcome = None  # 'success', 'failed', 'skipped' (duplicate photo) or None (not processed)
+
+        # Stage outputs carried over from an interrupted run
+        self.known_ocr_text = None
+        self.uploaded = False
+        self.resumed_title = False  # Title came from a run that may have uploaded it before being killed
+
+class UploadRun:
+    """Process the rows of one scraped spreadsheet through the stage pipeline"""
+
+    def __init__(self, df, state, image_processor, genai_client, translate_client, site, FilePage, pid_buffer,
+                 resume=None, photo_index=None, title_checker=None):
+        self.df = df
+        self.state = state
+        self.resume = resume or {}
+        self.pid_buffer = pid_buffer
+        self.photo_index = photo_index
+        self.title_checker = title_checker
+        self.image_processor = image_processor
+        self.genai_client = genai_client
+        self.translate_client = translate_client
+        self.site = site
+        self.FilePage = FilePage
+        self.total_rows = len(df)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def update(self, job, values):
+        """Write cells of a row and persist them to the run state store"""
+        with self._lock:
+            for col, value in values.items():
+                self.df.iat[job.idx, col] = value
+        self.state.set(job.unique_id, {RUN_COLUMNS[col]: value for col, value in values.items()})
+
+    def fail(self, job, values=None):
+        if values:
+            self.update(job, values)
+        job.outcome = 'failed'
+        job.result = None
+        if self.photo_index is not None:
+            self.photo_index.release(job.unique_id)
+        if self.title_checker is not None and job.title and not job.uploaded:
+            self.title_checker.release(job.title)
+
+    def on_error(self, job, stage, e):
+        logger.error(f"Error processing row {job.row}: {str(e)}")
+        self.fail(job, {13: f"Error: {str(e)}"})
+
+    def stage_process(self, job):
+        """Download and split the row image, leaving OCR to the batched stage"""
+        print(f"\n{'='*60}")
+        print(f"Processing row {job.row}/{self.total_rows}")
+        print(f"{'='*60}")
+
+        if not job.image_url or job.image_url == 'nan':
+            print(f"Row {job.row}: No URL, skipping")
+            self.update(job, {5: "No URL"})
+            return False
+
+        if job.uploaded:
+            print(f"Row {job.row}: Already uploaded in a previous run, only PIDDateData is pending")
+            return True
+
+        if self.photo_index is not None:
+            duplicate = self.photo_index.skipped_duplicate(job.image_url)
+            if duplicate:
+                return self.skip_duplicate(job, duplicate)
+
+        print(f"\nRow {job.row} STEP 2: Processing image...")
+        result = self.image_processor.segment_image(job.row, job.image_url)
+        job.result = result
+
+        # Stop before any paid API call if the photo is already on Commons or in this run
+        if DUPLICATE_CHECK and self.photo_index is not None and result['image'] is not None:
+            height, width = result['image'].shape[:2]
+            duplicate = self.photo_index.claim(
+                job.unique_id, dhash(result['image']), width / height, f"row {job.row} ({job.unique_id})",
+                url=job.image_url
+            )
+            if duplicate:
+                return self.skip_duplicate(job, duplicate)
+
+        if result['ocr_input'] is not None and job.known_ocr_text is not None:
+            print(f"Row {job.row}: Reusing OCR text from previous run")
+            self.image_processor.apply_ocr_text(result, job.known_ocr_text)
+
+        if result['ocr_input'] is None:
+            return self.finish_image(job)
+        return True
+
+    def skip_duplicate(self, job, duplicate):
+        """Skip a row whose photo is already on Commons or in this run"""
+        print(f"Row {job.row}: Same photo as {duplicate}, skipping "
+              f"(add its URL to {DUPLICATE_OVERRIDES_FILE} to upload it anyway)")
+        self.update(job, {5: f"Duplicate of {duplicate}"})
+        job.outcome = 'skipped'
+        job.result = None
+        return False
+
+    def stage_ocr(self, jobs):
+        """OCR the text sections of several rows in batched Vision requests"""
+        pending = [job for job in jobs if job.result is not None and job.result['ocr_input'] is not None]
+        if pending:
+            print(f"Rows {', '.join(str(job.row) for job in pending)}: Performing OCR...")
+            texts = self.image_processor.perform_ocr_batch([job.result['ocr_input'] for job in pending])
+            for job, text in zip(pending, texts):
+                self.image_processor.apply_ocr_text(job.result, text)
+                print(f"Row {job.row}: Image processing completed")
+
+        # Rows without pending OCR were already recorded by the process stage
+        return [job for job in jobs if job not in pending or self.finish_image(job)]
+
+    def finish_image(self, job):
+        """Record the image processing result and decide whether the row continues"""
+        result = job.result
+        self.update(job, {
+            4: result['ocr_text'],  # Column E: OCR text
+            5: result['status'],    # Column F: Status
+        })
+
+        if result['image'] is None or result['status'].startswith('Error') or result['status'].startswith('OCR failed'):
+            print(f"Row {job.row}: Image processing failed")
+            self.fail(job)
+            return False
+
+        return True
+
+    def stage_translate(self, jobs):
+        """Translate the OCR text of several rows to English"""
+        pending = []
+        for job in jobs:
+            if job.uploaded or job.translation:
+                print(f"Row {job.row}: Reusing translation from previous run")
+            else:
+                print(f"\nRow {job.row} STEP 3: Translating text...")
+                print(f"Row {job.row}: Sanitized OCR Data: {job.result['ocr_text']}")
+                pending.append(job)
+
+        if BATCH_TRANSLATION:
+            results = translate_batch(
+                self.genai_client, self.translate_client, [(job.row, job.result['ocr_text']) for job in pending]
+            )
+        else:
+            results = {
+                job.row: translate_text(self.genai_client, self.translate_client, job.result['ocr_text'], job.row)
+                for job in pending
+            }
+
+        passed = [job for job in jobs if job not in pending]
+        for job in pending:
+            translation, trans_status = results[job.row]
+            print(f"Row {job.row}: Translation Data: {translation}")
+
+            self.update(job, {
+                6: translation,   # Column G: Translation
+                7: trans_status,  # Column H: Translation status
+            })
+
+            if trans_status != "Success":
+                print(f"Row {job.row}: Translation failed")
+                self.fail(job)
+                continue
+
+            job.translation = translation
+            passed.append(job)
+
+        return passed
+
+    def stage_title(self, job):
+        """Generate the Commons filename"""
+        if job.uploaded or job.title:
+            print(f"Row {job.row}: Reusing title from previous run")
+            return True
+
+        print(f"\nRow {job.row} STEP 4: Generating title...")
+        img_format = job.result.get('format', 'jpg')
+        title, title_status = generate_title(self.genai_client, job.translation, job.date_str, job.row, img_format)
+        print(f"Row {job.row}: Full Title Data (with extension): {title}")
+
+        self.update(job, {
+            8: title,          # Column I: Title
+            9: title_status,   # Column J: Title status
+        })
+
+        if title_status != "Success":
+            print(f"Row {job.row}: Title generation failed")
+            self.fail(job)
+            return False
+
+        job.title = title
+        return True
+
+    def stage_describe(self, job):
+        """Translate the OCR text and generate the filename in one fused request"""
+        if job.uploaded or (job.translation and job.title):
+            print(f"Row {job.row}: Reusing translation and title from previous run")
+            return True
+        if job.translation:
+            return self.stage_title(job)
+
+        print(f"\nRow {job.row} STEP 3-4: Translating text and generating title...")
+        bengali_text = job.result['ocr_text']
+        print(f"Row {job.row}: Sanitized OCR Data: {bengali_text}")
+        img_format = job.result.get('format', 'jpg')
+        translation, trans_status, title, title_status = describe_image(
+            self.genai_client, self.translate_client, bengali_text, job.date_str, job.row, img_format
+        )
+        print(f"Row {job.row}: Translation Data: {translation}")
+
+        self.update(job, {
+            6: translation,   # Column G: Translation
+            7: trans_status,  # Column H: Translation status
+        })
+
+        if trans_status != "Success":
+            print(f"Row {job.row}: Translation failed")
+            self.fail(job)
+            return False
+
+        job.translation = translation
+        print(f"Row {job.row}: Full Title Data (with extension): {title}")
+
+        self.update(job, {
+            8: title,          # Column I: Title
+            9: title_status,   # Column J: Title status
+        })
+
+        if title_status != "Success":
+            print(f"Row {job.row}: Title generation failed")
+            self.fail(job)
+            return False
+
+        job.title = title
+        return True
+
+    def stage_titlecheck(self, jobs):
+        """Check the titles of several rows against Commons in bulk and number colliding ones"""
+        self.confirm_resumed_uploads([job for job in jobs if job.resumed_title and not job.uploaded])
+        pending = [job for job in jobs if not job.uploaded]
+        assigned = self.title_checker.assign({job.unique_id: job.title for job in pending})
+
+        passed = [job for job in jobs if job.uploaded]
+        for job in pending:
+            title = assigned[job.unique_id]
+            if not title:
+                print(f"Row {job.row}: {job.title} and its numbered variants already exist on Commons")
+                self.fail(job, {13: "Failed: File already exists"})
+                continue
+            if title != job.title:
+                print(f"Row {job.row}: {job.title} already exists on Commons, using {title}")
+                job.title = title
+                self.update(job, {8: title})  # Column I: Title
+            passed.append(job)
+        return passed
+
+    def confirm_resumed_uploads(self, jobs):
+        """Mark rows as uploaded when their carried-over title already holds this exact photo on Commons"""
+        taken = self.title_checker.existing([job.title for job in jobs]) if jobs else set()
+        for job in jobs:
+            if job.title not in taken:
+                continue
+
+            result = job.result
+            data = encode_upload_image(
+                result['image'], result.get('format', 'jpg'), result.get('exif'),
+                source=result.get('source'), photo_box=result.get('photo_box')
+            )
+            if commons_file_sha1(self.site, self.FilePage, job.title) != hashlib.sha1(data).hexdigest():
+                continue
+
+            print(f"Row {job.row}: {job.title} was uploaded by the interrupted run, not uploading again")
+            description = build_description(result['ocr_text'], job.translation, job.date_str, job.image_url)
+            self.update(job, {12: "'" + description, 13: "Success"})
+            job.uploaded = True
+            job.result = None
+            if self.photo_index is not None:
+                self.photo_index.mark_uploaded(job.unique_id, job.title)
+            self.title_checker.mark_uploaded(job.title)
+
+    def stage_upload(self, job):
+        """Upload to Commons and record the entry in PIDDateData"""
+        print(f"\nRow {job.row} STEP 5: Preparing metadata...")
+        data_entry = f'''        ["{job.image_url}"] = "{job.date_str}",'''
+
+        if job.uploaded:
+            job.outcome = 'success'
+            self.update(job, {10: data_entry})
+        else:
+            result = job.result
+            description = build_description(result['ocr_text'], job.translation, job.date_str, job.image_url)
+
+            self.update(job, {
+                10: data_entry,           # Column K: Data entry
+                12: "'" + description,    # Column M: Description
+            })
+
+            print(f"\nRow {job.row} STEP 6: Uploading to Wikimedia Commons...")
+            if not CONNECTIVITY.wait_until_online():
+                self.fail(job, {13: "Failed: No internet connection"})
+                return False
+            upload_success, upload_error = upload_to_commons(
+                self.site, self.FilePage, result['image'], job.title, result.get('format', 'jpg'), result.get('exif'), description,
+                source=result.get('source'), photo_box=result.get('photo_box'),
+                check_exists=self.title_checker is None
+            )
+            job.result = None
+
+            if upload_success is None:
+                # Commons holds the same bytes under another title; remember the URL so no later run processes it
+                print(f"Row {job.row}: Already on Commons as {upload_error}, skipping")
+                self.update(job, {5: f"Duplicate of {upload_error}", 13: "Skipped: already on Commons"})
+                job.outcome = 'skipped'
+                if self.photo_index is not None:
+                    self.photo_index.release(job.unique_id)
+                    self.photo_index.record_skipped(job.image_url, upload_error)
+                if self.title_checker is not None:
+                    self.title_checker.release(job.title)
+                return False
+
+            if not upload_success:
+                print(f"Row {job.row}: Upload failed - {upload_error}")
+                self.fail(job, {13: f"Failed: {upload_error}"})
+                return False
+
+            job.outcome = 'success'
+            print(f"Row {job.row}: Upload successful")
+            self.update(job, {13: "Success"})  # Column N: Upload status
+            if self.photo_index is not None:
+                self.photo_index.mark_uploaded(job.unique_id, job.title)
+            if self.title_checker is not None:
+                self.title_checker.mark_uploaded(job.title)
+
+        print(f"Row {job.row}: Buffering PIDDateData entry...")
+        self.update(job, {11: "Pending"})  # Column L: PIDDateData status
+        self.mark_committed(self.pid_buffer.add(job.unique_id, job.image_url, job.date_str, data_entry))
+
+        return True
+
+    def mark_committed(self, unique_ids):
+        """Record rows whose PIDDateData entries were written to the module"""
+        for unique_id in unique_ids:
+            job = self._jobs.get(unique_id)
+            if job is not None:
+                self.update(job, {11: "Success"})
+                print(f"Row {job.row}: PIDDateData updated")
+
+    def apply_resume(self, job, prior):
+        """Carry completed stage outputs of an interrupted run over to this row"""
+        carried = {}
+
+        if prior.get('upload_status') == 'Success':
+            job.uploaded = True
+            job.title = prior.get('title', '')
+            for col in (4, 5, 6, 7, 8, 9, 12, 13):
+                carried[col] = prior.get(RUN_COLUMNS[col], '')
+            if prior.get('pid_status') == 'Success':
+                carried[10] = prior.get('data_entry', '')
+                carried[11] = 'Success'
+                job.outcome = 'success'
+        elif (prior.get('status') or '').startswith('Success') and prior.get('ocr_text'):
+            job.known_ocr_text = prior['ocr_text']
+            if prior.get('trans_status') == 'Success' and prior.get('translation'):
+                job.translation = prior['translation']
+                carried.update({6: job.translation, 7: 'Success'})
+                if prior.get('title_status') == 'Success' and prior.get('title'):
+                    job.title = prior['title']
+                    job.resumed_title = True
+                    carried.update({8: job.title, 9: 'Success'})
+
+        if carried:
+            print(f"Row {job.row}: Resuming from previous run ({', '.join(RUN_COLUMNS[col] for col in sorted(carried))})")
+            with self._lock:
+                for col, value in carried.items():
+                    self.df.iat[job.idx, col] = value
+        return {RUN_COLUMNS[col]: value for col, value in carried.items()}
+
+    def jobs(self):
+        """Build row jobs, record their identity and apply any resumable state"""
+        df = self.df
+        jobs = []
+        seeded = {}
+        for idx in range(self.total_rows):
+            job = RowJob(
+                idx,
+                str(df.iat[idx, 0]) if pd.notna(df.iat[idx, 0]) else f"image_{idx}",
+                str(df.iat[idx, 1]) if pd.notna(df.iat[idx, 1]) else "",
+                str(df.iat[idx, 2]) if pd.notna(df.iat[idx, 2]) else "",
+            )
+            values = {'unique_id': job.unique_id, 'date': job.date_str, 'image_url': job.image_url}
+            prior = self.resume.get(normalize_url(job.image_url)) if job.image_url else None
+            if prior:
+                values.update(self.apply_resume(job, prior))
+            seeded[job.unique_id] = values
+            jobs.append(job)
+            self._jobs[job.unique_id] = job
+
+        self.state.set_rows(seeded)
+        return jobs
+
+    def run(self):
+        """Process all rows and return (success_count, failed_count, skipped_count)"""
+        stages = [
+            ('process', self.stage_process, PIPELINE_WORKERS['process']),
+            ('ocr', self.stage_ocr, PIPELINE_WORKERS['ocr'], OCR_BATCH_SIZE),
+        ]
+        if FUSED_TRANSLATE_TITLE:
+            stages.append(('describe', self.stage_describe, PIPELINE_WORKERS['translate']))
+        else:
+            stages += [
+                ('translate', self.stage_translate, PIPELINE_WORKERS['translate'],
+                 TRANSLATION_BATCH_SIZE if BATCH_TRANSLATION else 1),
+                ('title', self.stage_title, PIPELINE_WORKERS['title']),
+            ]
+        if self.title_checker is not None:
+            stages.append(('titlecheck', self.stage_titlecheck, 1, TITLE_CHECK_BATCH_SIZE))
+        stages.append(('upload', self.stage_upload, PIPELINE_WORKERS['upload']))
+        jobs = self.jobs()
+        pending = [job for job in jobs if job.outcome is None]
+        StagePipeline(stages, on_error=self.on_error).run(pending)
+        self.mark_committed(self.pid_buffer.flush())
+
+        success_count = sum(1 for job in jobs if job.outcome == 'success')
+        failed_count = sum(1 for job in jobs if job.outcome == 'failed')
+        skipped_count = sum(1 for job in jobs if job.outcome == 'skipped')
+        return success_count, failed_count, skipped_count
+
 def main():
+    global LLM_CACHE
+
     print("=" * 60)
     print("PID Image Processor & Uploader")
     print("=" * 60)
@@ -1337,6 +3636,9 @@ def main():
         print("Please create user-password.py in the same directory as this script")
         sys.exit(1)
 
+    if LOSSLESS_JPEG_CROP and not JPEGTRAN_PATH:
+        print("Note: jpegtran not found (package libjpeg-turbo-progs); JPEG photo sections will be re-encoded")
+
     # Step 1: Scrape data
     print("\n" + "=" * 60)
     print("STEP 1: Scraping data from pressinform.gov.bd")
@@ -1366,6 +3668,7 @@ def main():
         )
         translate_client = translate.Client()
         print("Google GenAI and Translate clients initialized")
+        LLM_CACHE = LLMCache()
 
         # Initialize Pywikibot
         print("\nInitializing Pywikibot...")
@@ -1376,6 +3679,12 @@ def main():
 
         site, FilePage = result
 
+        # Write PIDDateData entries left buffered by earlier runs
+        pid_buffer = PIDDateDataBuffer(site, index=PIDDateIndex())
+        if len(pid_buffer):
+            print(f"\nWriting {len(pid_buffer)} PIDDateData entries buffered by earlier runs...")
+            pid_buffer.flush()
+
         # Check if Excel file was created
         if excel_file is None:
             print("\nNo new images found. Logging to Commons...")
@@ -1395,136 +3704,33 @@ def main():
         while df.shape[1] < 14:
             df[df.shape[1]] = ""
 
-        # Process each row
-        success_count = 0
-        failed_count = 0
-
-        for idx in range(total_rows):
-            print(f"\n{'='*60}")
-            print(f"Processing row {idx + 1}/{total_rows}")
-            print(f"{'='*60}")
-
-            try:
-                unique_id = str(df.iat[idx, 0]) if pd.notna(df.iat[idx, 0]) else f"image_{idx}"
-                date_str = str(df.iat[idx, 1]) if pd.notna(df.iat[idx, 1]) else ""
-                image_url = str(df.iat[idx, 2]) if pd.notna(df.iat[idx, 2]) else ""
-
-                if not image_url or image_url == 'nan':
-                    print(f"Row {idx + 1}: No URL, skipping")
-                    df.iat[idx, 5] = "No URL"
-                    df.to_excel(excel_file, index=False, header=False)
-                    continue
-
-                # Step 2: Process image (download, split, OCR)
-                print(f"\nSTEP 2: Processing image...")
-                result = image_processor.process_image(idx + 1, image_url)
-
-                df.iat[idx, 4] = result['ocr_text']  # Column E: OCR text
-                df.iat[idx, 5] = result['status']     # Column F: Status
-                df.to_excel(excel_file, index=False, header=False)
-
-                if result['image'] is None or result['status'].startswith('Error') or result['status'].startswith('OCR failed'):
-                    print(f"Row {idx + 1}: Image processing failed")
-                    failed_count += 1
-                    continue
-
-                # Get image format
-                img_format = result.get('format', 'jpg')
-
-                # Step 3: Translate Bengali to English
-                print(f"\nSTEP 3: Translating text...")
-                bengali_text = result['ocr_text']
-                print(f"Sanitized OCR Data: {bengali_text}")
-                translation, trans_status = translate_text(genai_client, translate_client, bengali_text, idx + 1)
-                print(f"Translation Data: {translation}")
-
-                df.iat[idx, 6] = translation     # Column G: Translation
-                df.iat[idx, 7] = trans_status    # Column H: Translation status
-                df.to_excel(excel_file, index=False, header=False)
-
-                if trans_status != "Success":
-                    print(f"Row {idx + 1}: Translation failed")
-                    failed_count += 1
-                    continue
-
-                # Step 4: Generate title
-                print(f"\nSTEP 4: Generating title...")
-                title, title_status = generate_title(genai_client, translation, date_str, idx + 1, img_format)
-                print(f"Full Title Data (with extension): {title}")
-
-                df.iat[idx, 8] = title          # Column I: Title
-                df.iat[idx, 9] = title_status   # Column J: Title status
-                df.to_excel(excel_file, index=False, header=False)
-
-                if title_status != "Success":
-                    print(f"Row {idx + 1}: Title generation failed")
-                    failed_count += 1
-                    continue
-
-                # Step 5: Prepare description and data entry
-                print(f"\nSTEP 5: Preparing metadata...")
-                data_entry = f'''        ["{image_url}"] = "{date_str}",'''
-                df.iat[idx, 10] = data_entry  # Column K: Data entry
-
-                description = f'''=={{{{int:filedesc}}}}==
-{{{{Information
- |description = {{{{bn|1={bengali_text}}}}}{{{{en|1={translation}{{{{Auto-translated PID English description}}}}}}}}
- |date = {{{{Date-PID|{date_str}}}}}
- |source = {{{{Source-PID | url={image_url}}}}}
- |author = {{{{Institution:Press Information Department}}}}
- |permission =
- |other versions =
-}}}}
-=={{{{int:license-header}}}}==
-{{{{PD-BDGov-PID}}}}
-[[Category: Uploaded with pypan]]'''
-
-                df.iat[idx, 12] = "'" + description  # Column M: Description
-                df.to_excel(excel_file, index=False, header=False)
-
-                # Step 6: Upload to Wikimedia Commons
-                print(f"\nSTEP 6: Uploading to Wikimedia Commons...")
-                upload_success, upload_error = upload_to_commons(
-                    site, FilePage, result['image'], title, img_format, result.get('exif'), description
-                )
-
-                if upload_success:
-                    df.iat[idx, 13] = "Success"  # Column N: Upload status
-                    success_count += 1
-                    print(f"Row {idx + 1}: Upload successful")
-
-                    sleep(5)
-
-                    # Update PIDDateData
-                    print(f"Row {idx + 1}: Updating PIDDateData...")
-                    if update_pid_date_data(site, data_entry):
-                        df.iat[idx, 11] = "Success"  # Column L: PIDDateData status
-                        print(f"Row {idx + 1}: PIDDateData updated")
-                    else:
-                        df.iat[idx, 11] = "Failed"
-                        print(f"Row {idx + 1}: PIDDateData update failed")
-                else:
-                    df.iat[idx, 13] = f"Failed: {upload_error}"
-                    failed_count += 1
-                    print(f"Row {idx + 1}: Upload failed - {upload_error}")
-
-                df.to_excel(excel_file, index=False, header=False)
-
-            except Exception as e:
-                logger.error(f"Error processing row {idx + 1}: {str(e)}")
-                df.iat[idx, 13] = f"Error: {str(e)}"
-                failed_count += 1
-                df.to_excel(excel_file, index=False, header=False)
+        # Reuse stage outputs of runs that were killed before they could log
+        previous_states = find_previous_states() if RESUME_PREVIOUS_RUNS else []
+        resume = load_resume_data(previous_states)
+        if resume:
+            print(f"Found {len(resume)} rows from {len(previous_states)} unfinished run(s) to resume")
+
+        # Process rows through the staged pipeline; progress is journaled to the state store
+        state = RunStateStore.for_excel(excel_file)
+        photo_index = PhotoHashIndex()
+        run = UploadRun(
+            df, state, image_processor, genai_client, translate_client, site, FilePage, pid_buffer,
+            resume=resume, photo_index=photo_index, title_checker=CommonsTitleChecker()
+        )
+        success_count, failed_count, skipped_count = run.run()
 
-        # Final save
+        # Export the spreadsheet once, after all rows are done
         df.to_excel(excel_file, index=False, header=False)
 
         # Log results to Commons
         print("\nLogging results to Wikimedia Commons...")
-        if log_to_commons(site, df, success_count, failed_count, total_rows):
-            # Delete Excel file after successful logging
+        if log_to_commons(site, df, success_count, failed_count, total_rows, skipped_count):
+            # Delete Excel file and run state after successful logging
             try:
                 os.unlink(excel_file)
+                state.remove()
+                for previous_state in previous_states:
+                    remove_previous_run(previous_state)
                 print(f"Excel file deleted: {excel_file}")
             except Exception as e:
                 print(f"Warning: Could not delete Excel file: {e}")
@@ -1535,6 +3741,12 @@ def main():
         print(f"Total rows processed: {total_rows}")
         print(f"Successful uploads: {success_count}")
         print(f"Failed uploads: {failed_count}")
+        print(f"Skipped duplicates: {skipped_count}")
+        print(f"LLM cache: {LLM_CACHE.stats()}")
+        print(f"API rates: {', '.join(limiter.stats() for limiter in RATE_LIMITERS.values())}")
+        for line in HTTP.stats():
+            print(f"HTTP {line}")
+        print(f"Uploads: {UPLOAD_STATS.summary()}")
         print(f"Results saved to: {excel_file}")
         print("=" * 60)
 
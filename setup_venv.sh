@@ -23,4 +23,9 @@ pip install -U pip wheel setuptools
 pip install $HOME/pywikibot-core[mwoauth,mysql]
 pip install -r $HOME/requirements.txt
 
+# jpegtran (libjpeg-turbo-progs) crops JPEG photos losslessly; without it they are re-encoded
+if ! command -v jpegtran >/dev/null 2>&1; then
+    echo "Note: jpegtran not found; install libjpeg-turbo-progs for lossless JPEG crops"
+fi
+
 echo "Virtual environment setup complete!"
\ No newline at end of file
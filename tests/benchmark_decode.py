@@ -0,0 +1,102 @@
+"""Time and memory of ImageProcessor.decode_image against the decode it replaced, on large scans
+
+Run from the repository root:
+
+    python3 tests/benchmark_decode.py [--repeat N]
+
+Peak memory is what tracemalloc sees of Python and NumPy allocations during one decode.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image, ImageFile, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('PYWIKIBOT_NO_USER_CONFIG', '1')
+
+from main import ImageProcessor  # noqa: E402
+
+
+def baseline_decode(content):
+    """The download decode decode_image replaced: exif_transpose, PIL->NumPy copy, RGB->BGR"""
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+    img_pil = Image.open(BytesIO(content))
+    exif_data = img_pil.info.get('exif', None)
+    img_pil = ImageOps.exif_transpose(img_pil)
+    if img_pil.mode not in ('RGB', 'L', 'RGBA'):
+        img_pil = img_pil.convert('RGB')
+    img_format = img_pil.format.lower() if img_pil.format else 'jpg'
+    img_np = np.array(img_pil)
+    if img_np.ndim == 2:
+        img_cv = cv2.cvtColor(img_np, cv2.COLOR_GRAY2BGR)
+    elif img_np.shape[2] == 4:
+        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGBA2BGR)
+    else:
+        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+    return img_cv, img_format, exif_data
+
+
+def scan(width, height, mode='RGB', save_format='JPEG', orientation=None):
+    """Photo above a white caption band, encoded like the scans on pressinform.gov.bd"""
+    rng = np.random.default_rng(0)
+    photo = cv2.resize(rng.integers(0, 256, (48, 64, 3), dtype=np.uint8), (width, height * 4 // 5))
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    pixels[:photo.shape[0]] = photo
+    image = Image.fromarray(pixels).convert(mode)
+
+    kwargs = {'quality': 90} if save_format == 'JPEG' else {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs['exif'] = exif.tobytes()
+    buffer = BytesIO()
+    image.save(buffer, save_format, **kwargs)
+    return buffer.getvalue()
+
+
+FIXTURES = {
+    'RGB JPEG 6000x4000': lambda: scan(6000, 4000),
+    'RGB JPEG 6000x4000, rotated': lambda: scan(6000, 4000, orientation=6),
+    'CMYK JPEG 4000x3000': lambda: scan(4000, 3000, mode='CMYK'),
+    'Greyscale JPEG 4000x3000': lambda: scan(4000, 3000, mode='L'),
+    'RGBA PNG 3000x2000': lambda: scan(3000, 2000, mode='RGBA', save_format='PNG'),
+}
+
+
+def measure(decode, content, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(content)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    decode(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='timed decodes per fixture (default 5)')
+    args = parser.parse_args()
+
+    processor = ImageProcessor(wayback=object())
+    print(f"{'fixture':30} {'baseline':>16} {'decode_image':>16}")
+    for name, build in FIXTURES.items():
+        content = build()
+        old_time, old_peak = measure(baseline_decode, content, args.repeat)
+        new_time, new_peak = measure(processor.decode_image, content, args.repeat)
+        print(f"{name:30} {old_time:7.3f}s {old_peak:5.0f} MB {new_time:7.3f}s {new_peak:5.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# pywikibot refuses to import without a user-config.py unless told not to look for one
+os.environ.setdefault('PYWIKIBOT_NO_USER_CONFIG', '1')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+import requests
+from google.api_core import exceptions as google_exceptions
+
+import main
+from main import ConnectivityMonitor, is_transport_error
+
+
+def wrapped(error, outer):
+    try:
+        raise outer from error
+    except Exception as e:
+        return e
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ConnectionError(),
+    google_exceptions.ServiceUnavailable('failed to connect to all addresses'),
+    google_exceptions.DeadlineExceeded('Deadline Exceeded'),
+    google_exceptions.RetryError('Deadline of 600.0s exceeded', google_exceptions.ServiceUnavailable('unavailable')),
+    wrapped(OSError('Network is unreachable'), google_exceptions.ServiceUnavailable('unavailable')),
+    wrapped(ConnectionResetError(), RuntimeError('client error')),
+])
+def test_transport_errors(error):
+    assert is_transport_error(error)
+
+
+@pytest.mark.parametrize('error', [
+    google_exceptions.InvalidArgument('bad image'),
+    google_exceptions.TooManyRequests('quota'),
+    ValueError('no text'),
+])
+def test_request_errors(error):
+    assert not is_transport_error(error)
+
+
+def offline_monitor(monkeypatch, run_deadline):
+    monkeypatch.setattr(main, 'check_internet', lambda: False)
+    monkeypatch.setattr(main, 'sleep', lambda seconds: time.sleep(0.01))
+    monitor = ConnectivityMonitor(failure_threshold=1, run_deadline=run_deadline)
+    monitor.record_failure(google_exceptions.ServiceUnavailable('unavailable'))
+    return monitor
+
+
+def test_vision_outage_opens_the_circuit(monkeypatch):
+    monitor = offline_monitor(monkeypatch, run_deadline=0.0)
+
+    assert monitor.outages == 1
+    with pytest.raises(ConnectionError):
+        monitor.call(lambda: None)
+
+
+def test_waits_end_at_the_run_deadline(monkeypatch):
+    monitor = offline_monitor(monkeypatch, run_deadline=0.2)
+
+    start = time.monotonic()
+    assert not monitor.wait_until_online(timeout=60)
+    assert not monitor.wait_until_online(timeout=60)
+    assert time.monotonic() - start < 1
+
+
+def test_online_callers_do_not_wait(monkeypatch):
+    monitor = ConnectivityMonitor(run_deadline=0.0)
+
+    assert monitor.wait_until_online()
+    assert monitor.call(lambda: 'ok') == 'ok'
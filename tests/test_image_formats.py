@@ -0,0 +1,99 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+import main
+from main import ImageProcessor
+
+
+def encoded(save_format, size=(80, 64), mode='RGB', **kwargs):
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+    buffer = BytesIO()
+    image.convert(mode).save(buffer, save_format, **kwargs)
+    return buffer.getvalue()
+
+
+def camera_mpo(orientation=1):
+    """JPEG with a multi-picture index and a second image, as many cameras write them"""
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    preview = Image.new('RGB', (40, 32), (200, 10, 10))
+    return encoded('MPO', save_all=True, append_images=[preview], exif=exif.tobytes())
+
+
+@pytest.fixture
+def processor():
+    return ImageProcessor(wayback=object())
+
+
+def test_mpo_is_treated_as_jpeg(processor):
+    content = camera_mpo()
+    assert Image.open(BytesIO(content)).format == 'MPO'
+
+    image, img_format, exif = processor.decode_image(content)
+
+    assert img_format == 'jpg'
+    assert image.shape == (64, 80, 3)
+    assert exif is not None
+
+
+def test_mpo_orientation_is_applied(processor):
+    image, img_format, _ = processor.decode_image(camera_mpo(orientation=6))
+
+    assert img_format == 'jpg'
+    assert image.shape == (80, 64, 3)
+
+
+@pytest.mark.parametrize('save_format, mode, expected', [
+    ('JPEG', 'RGB', 'jpg'),
+    ('PNG', 'RGBA', 'png'),
+    ('TIFF', 'RGB', 'tif'),
+    ('GIF', 'P', 'jpg'),
+    ('WEBP', 'RGB', 'jpg'),
+    ('BMP', 'RGB', 'jpg'),
+])
+def test_source_formats_map_to_upload_formats(processor, save_format, mode, expected):
+    image, img_format, _ = processor.decode_image(encoded(save_format, mode=mode))
+
+    assert img_format == expected
+    assert image.shape == (64, 80, 3) and image.dtype == np.uint8
+
+    data = main.encode_upload_image(image, img_format, None)
+    assert Image.open(BytesIO(data)).format == {'jpg': 'JPEG', 'png': 'PNG', 'tif': 'TIFF'}[img_format]
+
+
+@pytest.mark.parametrize('img_format, mime_type', [
+    ('jpg', 'image/jpeg'),
+    ('png', 'image/png'),
+    ('tif', 'image/tiff'),
+    ('mpo', 'image/jpeg'),
+    ('gif', 'image/jpeg'),
+    ('webp', 'image/jpeg'),
+    ('unknown', 'image/jpeg'),
+])
+def test_upload_mime_type_is_limited_to_upload_formats(img_format, mime_type):
+    assert main.upload_mime_type(img_format) == mime_type
+
+
+def test_mpo_upload_is_a_jpeg(processor):
+    image, img_format, exif = processor.decode_image(camera_mpo())
+    data = main.encode_upload_image(image, img_format, exif)
+
+    assert Image.open(BytesIO(data)).format == 'JPEG'
+    assert main.upload_mime_type(img_format) == 'image/jpeg'
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_orientation_matches_exif_transpose(processor, orientation, mode):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    content = encoded('PNG', size=(7, 5), mode=mode, exif=exif.tobytes())
+
+    image, _, _ = processor.decode_image(content)
+
+    expected = np.asarray(ImageOps.exif_transpose(Image.open(BytesIO(content))).convert('RGB'))
+    assert image.flags['C_CONTIGUOUS']
+    assert np.array_equal(image, expected)
@@ -0,0 +1,145 @@
+import struct
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import ExifTags, Image
+
+import main
+
+needs_jpegtran = pytest.mark.skipif(main.JPEGTRAN_PATH is None, reason='jpegtran (libjpeg-turbo-progs) not installed')
+
+
+def camera_exif(width, height, orientation=1):
+    """EXIF as cameras write it: make, orientation, pixel dimensions and an IFD1 thumbnail"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Canon'
+    exif[0x0112] = orientation
+    exif.get_ifd(0x8769).update({0xA002: width, 0xA003: height})
+    data = bytearray(exif.tobytes()[6:])  # TIFF structure after the "Exif\0\0" header
+
+    thumbnail = BytesIO()
+    Image.new('RGB', (16, 12), (255, 0, 0)).save(thumbnail, 'JPEG')
+    thumbnail = thumbnail.getvalue()
+
+    # Chain an IFD1 holding the thumbnail behind IFD0
+    order = '<' if data[:2] == b'II' else '>'
+    ifd0 = struct.unpack_from(order + 'I', data, 4)[0]
+    entries = struct.unpack_from(order + 'H', data, ifd0)[0]
+    ifd1 = len(data)
+    struct.pack_into(order + 'I', data, ifd0 + 2 + 12 * entries, ifd1)
+    data += struct.pack(order + 'H', 2)
+    data += struct.pack(order + 'HHII', 0x0201, 4, 1, ifd1 + 2 + 2 * 12 + 4)
+    data += struct.pack(order + 'HHII', 0x0202, 4, 1, len(thumbnail))
+    data += struct.pack(order + 'I', 0) + thumbnail
+    return b'Exif\x00\x00' + bytes(data)
+
+
+def jpeg(width=160, height=128, mode='RGB', subsampling=2, save_format='JPEG', **kwargs):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8).repeat(8, 0).repeat(8, 1)
+    buffer = BytesIO()
+    Image.fromarray(pixels).convert(mode).save(
+        buffer, save_format, quality=90, subsampling=subsampling, exif=camera_exif(width, height), **kwargs
+    )
+    return buffer.getvalue()
+
+
+def thumbnail_ifd(exif_bytes):
+    exif = Image.Exif()
+    exif.load(exif_bytes)
+    return exif.get_ifd(ExifTags.IFD.IFD1)
+
+
+def test_fixture_has_a_thumbnail():
+    assert 0x0201 in thumbnail_ifd(Image.open(BytesIO(jpeg())).info['exif'])
+
+
+def test_upload_exif_describes_the_uploaded_pixels():
+    exif_bytes = main.upload_exif(camera_exif(160, 128, orientation=6), (96, 64))
+
+    exif = Image.Exif()
+    exif.load(exif_bytes)
+    assert exif[0x010F] == 'Canon'
+    assert exif[0x0112] == 1
+    assert exif.get_ifd(0x8769)[0xA002] == 96 and exif.get_ifd(0x8769)[0xA003] == 64
+    assert thumbnail_ifd(exif_bytes) == {}
+
+
+def test_upload_exif_without_exif():
+    assert main.upload_exif(None, (96, 64)) is None
+    assert main.upload_exif(b'Exif\x00\x00garbage', (96, 64)) is None
+
+
+def test_reencoded_upload_carries_the_rewritten_exif():
+    image = np.zeros((64, 96, 3), dtype=np.uint8)
+    data = main.encode_upload_image(image, 'jpg', camera_exif(160, 128, orientation=6))
+
+    exif = Image.open(BytesIO(data)).getexif()
+    assert exif[0x0112] == 1
+    assert exif.get_ifd(0x8769)[0xA002] == 96
+
+
+def test_insert_jpeg_exif_after_jfif():
+    buffer = BytesIO()
+    Image.new('RGB', (16, 16)).save(buffer, 'JPEG')
+    data = main.insert_jpeg_exif(buffer.getvalue(), main.upload_exif(camera_exif(16, 16), (16, 16)))
+
+    assert data[2:4] == b'\xff\xe0'
+    image = Image.open(BytesIO(data))
+    assert image.getexif()[0x010F] == 'Canon'
+    image.load()
+
+
+@needs_jpegtran
+def test_crop_box_is_exact_and_lossless():
+    source = jpeg(mode='L')
+    box = (16, 32, 96, 64)
+
+    data = main.crop_jpeg_lossless(source, box)
+
+    assert data is not None
+    cropped = Image.open(BytesIO(data))
+    assert cropped.size == (96, 64)
+    expected = np.asarray(Image.open(BytesIO(source)))[32:96, 16:112]
+    assert np.array_equal(np.asarray(cropped), expected)
+
+
+@needs_jpegtran
+@pytest.mark.parametrize('subsampling, mcu', [(0, 8), (2, 16)])
+def test_crop_only_on_the_mcu_grid(subsampling, mcu):
+    source = jpeg(subsampling=subsampling)
+
+    assert main.crop_jpeg_lossless(source, (mcu, mcu, 64, 48)) is not None
+    assert main.crop_jpeg_lossless(source, (mcu // 2, 0, 64, 48)) is None
+    assert main.crop_jpeg_lossless(source, (0, mcu // 2, 64, 48)) is None
+
+
+@needs_jpegtran
+def test_crop_rewrites_exif():
+    data = main.crop_jpeg_lossless(jpeg(), (16, 16, 96, 64))
+
+    exif_bytes = Image.open(BytesIO(data)).info['exif']
+    exif = Image.Exif()
+    exif.load(exif_bytes)
+    assert exif[0x010F] == 'Canon'
+    assert exif.get_ifd(0x8769)[0xA002] == 96 and exif.get_ifd(0x8769)[0xA003] == 64
+    assert thumbnail_ifd(exif_bytes) == {}
+
+
+@needs_jpegtran
+def test_mpo_crops_to_a_plain_jpeg():
+    preview = Image.new('RGB', (40, 32), (200, 10, 10))
+    source = jpeg(save_format='MPO', save_all=True, append_images=[preview])
+    assert Image.open(BytesIO(source)).format == 'MPO'
+
+    data = main.crop_jpeg_lossless(source, (16, 16, 96, 64))
+
+    cropped = Image.open(BytesIO(data))
+    assert cropped.format == 'JPEG' and cropped.size == (96, 64)
+
+
+def test_nothing_is_cropped_without_jpegtran(monkeypatch):
+    monkeypatch.setattr(main, 'JPEGTRAN_PATH', None)
+
+    assert main.crop_jpeg_lossless(jpeg(), (16, 16, 96, 64)) is None
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import main
+from main import ImageProcessor
+
+
+class FakeVisionClient:
+    """Answers Vision requests from a {png bytes: text} table, recording each call"""
+
+    def __init__(self, texts, failing=(), fail_batches=False):
+        self.texts = texts
+        self.failing = set(failing)
+        self.fail_batches = fail_batches
+        self.batch_sizes = []
+        self.single_calls = 0
+
+    def _annotation(self, content):
+        return SimpleNamespace(
+            error=SimpleNamespace(message=''),
+            text_annotations=[SimpleNamespace(description=self.texts[content])],
+        )
+
+    def batch_annotate_images(self, requests):
+        self.batch_sizes.append(len(requests))
+        if self.fail_batches:
+            raise RuntimeError('batch rejected')
+        responses = []
+        for request in requests:
+            content = request.image.content
+            if content in self.failing:
+                responses.append(SimpleNamespace(error=SimpleNamespace(message='image too small'), text_annotations=[]))
+            else:
+                responses.append(self._annotation(content))
+        return SimpleNamespace(responses=responses)
+
+    def text_detection(self, image, image_context=None):
+        self.single_calls += 1
+        return self._annotation(image.content)
+
+
+@pytest.fixture
+def processor_and_images():
+    processor = ImageProcessor(wayback=object())
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (8, 24, 3), dtype=np.uint8) for _ in range(20)]
+    texts = {processor.encode_png(image): f"caption {i}" for i, image in enumerate(images)}
+    return processor, images, texts
+
+
+def test_batched_ocr_returns_texts_in_input_order(processor_and_images, monkeypatch):
+    processor, images, texts = processor_and_images
+    processor.vision_client = FakeVisionClient(texts)
+    monkeypatch.setattr(main, 'OCR_BATCH_SIZE', 8)
+
+    result = processor.perform_ocr_batch(images)
+
+    assert result == [f"caption {i}" for i in range(20)]
+    assert processor.vision_client.batch_sizes == [8, 8, 4]
+    assert processor.vision_client.single_calls == 0
+
+
+def test_batched_ocr_respects_byte_limit(processor_and_images, monkeypatch):
+    processor, images, texts = processor_and_images
+    processor.vision_client = FakeVisionClient(texts)
+    size = max(len(content) for content in texts)
+    monkeypatch.setattr(main, 'OCR_BATCH_MAX_BYTES', size * 3)
+
+    result = processor.perform_ocr_batch(images)
+
+    assert result == [f"caption {i}" for i in range(20)]
+    assert max(processor.vision_client.batch_sizes) <= 3
+    assert sum(processor.vision_client.batch_sizes) == 20
+
+
+def test_failed_items_are_retried_singly(processor_and_images):
+    processor, images, texts = processor_and_images
+    failing = [processor.encode_png(images[3]), processor.encode_png(images[11])]
+    processor.vision_client = FakeVisionClient(texts, failing=failing)
+
+    result = processor.perform_ocr_batch(images)
+
+    assert result == [f"caption {i}" for i in range(20)]
+    assert processor.vision_client.single_calls == 2
+
+
+def test_rejected_batch_falls_back_to_single_requests(processor_and_images):
+    processor, images, texts = processor_and_images
+    processor.vision_client = FakeVisionClient(texts, fail_batches=True)
+
+    result = processor.perform_ocr_batch(images[:5])
+
+    assert result == [f"caption {i}" for i in range(5)]
+    assert processor.vision_client.single_calls == 5
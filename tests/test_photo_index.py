@@ -0,0 +1,169 @@
+import cv2
+import numpy as np
+import pytest
+
+import main
+from main import PhotoHashIndex, dhash
+
+
+def photo(seed, height=300, width=400):
+    """Smooth random photo-like image, so resizing and recompression keep its structure"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def flip_bits(photo_hash, count):
+    for bit in range(count):
+        photo_hash ^= 1 << (bit * 7)
+    return photo_hash
+
+
+def recompress(image, quality=60):
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+
+
+@pytest.fixture
+def index_paths(tmp_path):
+    return str(tmp_path / 'photo_hashes.db'), str(tmp_path / 'duplicate_overrides.txt')
+
+
+def open_index(index_paths, **kwargs):
+    path, overrides = index_paths
+    return PhotoHashIndex(path, overrides_path=overrides, **kwargs)
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_dhash_survives_resizing_and_recompression(seed):
+    image = photo(seed)
+    copy = recompress(cv2.resize(image, (200, 150), interpolation=cv2.INTER_AREA))
+
+    assert distance(dhash(image), dhash(copy)) <= main.DUPLICATE_MAX_DISTANCE
+
+
+def test_dhash_separates_different_photos():
+    hashes = [dhash(photo(seed)) for seed in range(10)]
+
+    assert all(0 <= h < 1 << 64 for h in hashes)
+    assert min(distance(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]) > main.DUPLICATE_MAX_DISTANCE
+
+
+def test_hamming_threshold(index_paths):
+    index = open_index(index_paths, max_distance=3)
+    photo_hash = dhash(photo(0)) | 1 << 63  # exercises the signed SQLite round trip too
+    assert index.claim('a', photo_hash, 1.5, 'row 1') is None
+    index.mark_uploaded('a', 'Uploaded.jpg')
+
+    assert index.claim('b', flip_bits(photo_hash, 3), 1.5, 'row 2') == 'File:Uploaded.jpg'
+    assert index.claim('c', flip_bits(photo_hash, 4), 1.5, 'row 3') is None
+
+
+def test_aspect_ratio_must_agree(index_paths):
+    index = open_index(index_paths)
+    assert index.claim('a', 12345, 1.5, 'row 1') is None
+    index.mark_uploaded('a', 'Uploaded.jpg')
+
+    assert index.claim('b', 12345, 1.5 * (1 + main.DUPLICATE_MAX_ASPECT_DIFF / 2), 'row 2') == 'File:Uploaded.jpg'
+    assert index.claim('c', 12345, 1.0, 'row 3') is None
+
+
+def test_claims_within_a_run_and_release(index_paths):
+    index = open_index(index_paths)
+
+    assert index.claim('a', 12345, 1.5, 'row 1', url='https://example.org/a.jpg') is None
+    assert index.claim('a', 12345, 1.5, 'row 1') is None  # a row never matches its own claim
+    assert index.claim('b', 12345, 1.5, 'row 2', url='https://example.org/b.jpg') == 'row 1'
+    # In-run matches are not remembered: the first copy may still fail
+    assert index.skipped_urls() == set()
+
+    index.release('a')
+    assert index.claim('b', 12345, 1.5, 'row 2') is None
+
+
+def test_uploads_persist_and_skips_are_remembered(index_paths):
+    index = open_index(index_paths)
+    index.claim('a', 12345, 1.5, 'row 1')
+    index.mark_uploaded('a', 'Uploaded.jpg')
+    index.mark_uploaded('missing', 'Never claimed.jpg')
+    assert len(index) == 1
+
+    reopened = open_index(index_paths)
+    assert len(reopened) == 1
+    assert reopened.claim('b', 12345, 1.5, 'row 2', url='https://example.org/b.jpg') == 'File:Uploaded.jpg'
+
+    again = open_index(index_paths)
+    assert again.skipped_duplicate('https://example.org/b.jpg') == 'File:Uploaded.jpg'
+    assert again.skipped_urls() == {main.normalize_url('https://example.org/b.jpg')}
+    assert again.skipped_duplicate('https://example.org/c.jpg') is None
+
+
+def test_commons_duplicates_are_remembered(index_paths):
+    index = open_index(index_paths)
+    index.record_skipped('https://example.org/b.jpg', 'File:Same photo.jpg')
+
+    reopened = open_index(index_paths)
+    assert reopened.skipped_duplicate('https://example.org/b.jpg') == 'File:Same photo.jpg'
+    assert reopened.skipped_urls() == {main.normalize_url('https://example.org/b.jpg')}
+
+
+def test_overrides_are_never_skipped(index_paths):
+    path, overrides = index_paths
+    index = open_index(index_paths)
+    index.claim('a', 12345, 1.5, 'row 1')
+    index.mark_uploaded('a', 'Uploaded.jpg')
+    index.claim('b', 12345, 1.5, 'row 2', url='https://example.org/b.jpg')
+
+    with open(overrides, 'w', encoding='utf-8') as f:
+        f.write('# uploaded on purpose\nhttps://example.org/b.jpg\n')
+    index = open_index(index_paths)
+
+    assert index.overridden('https://example.org/b.jpg')
+    assert index.skipped_duplicate('https://example.org/b.jpg') is None
+    assert index.claim('b', 12345, 1.5, 'row 2', url='https://example.org/b.jpg') is None
+    assert index.skipped_urls() == set()
+
+
+def test_scrape_treats_skipped_urls_as_handled(index_paths, tmp_path, monkeypatch):
+    index = open_index(index_paths)
+    index.claim('a', 12345, 1.5, 'row 1')
+    index.mark_uploaded('a', 'Uploaded.jpg')
+    index.claim('b', 12345, 1.5, 'row 2', url='https://example.org/skipped.jpg')
+
+    class Index(set):
+        def refresh(self, year):
+            pass
+
+        def count(self, year):
+            return len(self)
+
+    class Fetcher:
+        def __init__(self, wikimedia_urls):
+            pass
+
+        def pages(self, initial_window=None):
+            yield 1, [('https://example.org/skipped.jpg', '2024-05-02'), ('https://example.org/old.jpg', '2024-05-01')]
+            raise AssertionError('the scrape should stop at the checkpoint on page 1')
+
+        def close(self):
+            pass
+
+    checkpoint_path = str(tmp_path / 'scrape_checkpoint.json')
+    main.save_scrape_checkpoint([{'url': main.normalize_url('https://example.org/old.jpg'), 'date': '2024-05-01'}],
+                                checkpoint_path)
+    load_checkpoint, save_checkpoint = main.load_scrape_checkpoint, main.save_scrape_checkpoint
+    monkeypatch.setattr(main, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(main, 'PIDDateIndex', lambda: Index({main.normalize_url('https://example.org/old.jpg')}))
+    monkeypatch.setattr(main, 'PageFetcher', Fetcher)
+    monkeypatch.setattr(main, 'PhotoHashIndex', lambda: open_index(index_paths))
+    monkeypatch.setattr(main, 'load_scrape_checkpoint', lambda: load_checkpoint(checkpoint_path))
+    monkeypatch.setattr(main, 'save_scrape_checkpoint', lambda entries: save_checkpoint(entries, checkpoint_path))
+
+    assert main.scrape_data() is None   # nothing new, and no request past page 1
+
+    urls = [entry['url'] for entry in load_checkpoint(checkpoint_path)['entries']]
+    assert main.normalize_url('https://example.org/skipped.jpg') in urls
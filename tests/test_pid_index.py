@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+
+import main
+from main import PIDDateIndex
+
+
+def module(*entries):
+    return 'return {\n' + ''.join(f'    ["{url}"] = "{date}",\n' for url, date in entries) + '}\n'
+
+
+class Wiki:
+    """Stands in for the revisions API of Module:PIDDateData"""
+
+    def __init__(self):
+        self.revid = 0
+        self.content = None
+        self.downloads = 0
+
+    def edit(self, *entries):
+        self.revid += 1
+        self.content = module(*entries)
+
+    def query_revision(self, year, with_content):
+        if with_content:
+            self.downloads += 1
+        return self.revid, self.content if with_content else None
+
+
+@pytest.fixture
+def wiki(monkeypatch):
+    wiki = Wiki()
+    monkeypatch.setattr(PIDDateIndex, '_query_revision', lambda self, year, with_content: wiki.query_revision(year, with_content))
+    return wiki
+
+
+def url(name):
+    return f'https://pressinform.gov.bd/sites/default/files/{name}.jpg'
+
+
+def dates(index, year=2024):
+    rows = index.conn.execute('SELECT url, date FROM entries WHERE year = ?', (year,)).fetchall()
+    return dict(rows)
+
+
+def test_unchanged_revision_is_not_downloaded(wiki, tmp_path):
+    index = PIDDateIndex(str(tmp_path / 'pid_index.db'))
+    wiki.edit((url('a'), '2024-05-01'))
+
+    assert index.refresh(2024) and index.refresh(2024)
+    assert wiki.downloads == 1
+    assert main.normalize_url(url('a')) in index
+
+
+def test_edited_and_removed_entries_are_synced(wiki, tmp_path):
+    index = PIDDateIndex(str(tmp_path / 'pid_index.db'))
+    wiki.edit((url('a'), '2024-05-01'), (url('b'), '2024-05-02'))
+    index.refresh(2024)
+
+    wiki.edit((url('a'), '2024-06-01'), (url('c'), '2024-05-03'))
+    assert index.refresh(2024)
+
+    assert dates(index) == {main.normalize_url(url('a')): '2024-06-01', main.normalize_url(url('c')): '2024-05-03'}
+    assert index.cached_revid(2024) == 2
+
+
+def test_local_entries_survive_until_the_module_lists_them(wiki, tmp_path):
+    index = PIDDateIndex(str(tmp_path / 'pid_index.db'))
+    wiki.edit((url('a'), '2024-05-01'))
+    index.refresh(2024)
+    index.add(url('uploaded'), '2024-05-04', 2024)
+
+    wiki.edit((url('a'), '2024-05-01'), (url('b'), '2024-05-02'))
+    index.refresh(2024)
+    assert main.normalize_url(url('uploaded')) in index
+
+    wiki.edit((url('b'), '2024-05-02'), (url('uploaded'), '2024-05-04'))
+    index.refresh(2024)
+    wiki.edit((url('b'), '2024-05-02'))
+    index.refresh(2024)
+    assert dates(index) == {main.normalize_url(url('b')): '2024-05-02'}
+
+
+def test_other_years_are_untouched(wiki, tmp_path):
+    index = PIDDateIndex(str(tmp_path / 'pid_index.db'))
+    index.add_entries({main.normalize_url(url('old')): '2023-01-01'}, 2023)
+    wiki.edit((url('a'), '2024-05-01'))
+
+    index.refresh(2024)
+
+    assert dates(index, 2023) == {main.normalize_url(url('old')): '2023-01-01'}
+
+
+def test_index_without_local_column_is_migrated(wiki, tmp_path):
+    path = str(tmp_path / 'pid_index.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE entries (url TEXT PRIMARY KEY, date TEXT, year INTEGER)')
+    conn.execute('INSERT INTO entries VALUES (?, ?, ?)', (main.normalize_url(url('stale')), '2024-01-01', 2024))
+    conn.commit()
+    conn.close()
+    wiki.edit((url('a'), '2024-05-01'))
+
+    index = PIDDateIndex(path)
+    index.refresh(2024)
+
+    assert dates(index) == {main.normalize_url(url('a')): '2024-05-01'}
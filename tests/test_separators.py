@@ -0,0 +1,342 @@
+import math
+
+import numpy as np
+import pytest
+
+from main import ImageProcessor
+
+# The scans below are the per-pixel loops the vectorized ImageProcessor methods
+# replaced, kept as regression references. They ran on the BGR arrays the old
+# decode produced, so callers pass them the image with its channels reversed.
+
+WHITE_BGR = np.array([255, 255, 255], dtype=np.uint8)
+FBF9FA_BGR = np.array([250, 249, 251], dtype=np.uint8)
+COLOR_TOLERANCE = 255 * 0.02
+
+
+def bgr(image):
+    return np.ascontiguousarray(image[..., ::-1])
+
+
+def reference_background_mask(pixels):
+    """Per-pixel white or fbf9fa test of the old side and fallback scans"""
+    white_diff = np.abs(pixels.astype(np.float32) - WHITE_BGR.astype(np.float32))
+    white_matching = np.all(white_diff <= COLOR_TOLERANCE, axis=-1)
+
+    fbf9fa_diff = np.abs(pixels.astype(np.float32) - FBF9FA_BGR.astype(np.float32))
+    fbf9fa_matching = np.all(fbf9fa_diff <= COLOR_TOLERANCE, axis=-1)
+
+    return white_matching | fbf9fa_matching
+
+
+def reference_uniform_columns(image, columns, start_row):
+    """Uniform run above the bottom edge of each column, one pixel at a time"""
+    height = image.shape[0]
+    column_heights = {}
+
+    for col in columns:
+        column_height = -1
+        color_samples = []
+
+        for y in range(height-6, start_row-1, -1):
+            pixel = image[y, col]
+
+            if len(color_samples) == 0:
+                color_samples.append(pixel)
+                column_height = y
+            else:
+                avg_color = np.mean(color_samples, axis=0)
+                color_diff = np.abs(pixel.astype(np.float32) - avg_color)
+                is_matching = np.all(color_diff <= 255 * 0.02)
+
+                if is_matching:
+                    color_samples.append(pixel)
+                    column_height = y
+                else:
+                    column_heights[col] = height - 1 - y
+                    break
+
+        if column_height != -1 and col not in column_heights:
+            column_heights[col] = height - 1 - start_row
+
+    return column_heights
+
+
+def reference_find_separator_fallback(image, start_row):
+    """Row-by-row search for a run of background rows below start_row"""
+    height, width = image.shape[:2]
+
+    fallback_consecutive_similar_lines = 0
+    fallback_separator_row = -1
+
+    fallback_required_lines = round((4 / math.log(3100 / 670)) * math.log(height / 670) + 5)
+    if fallback_required_lines <= 1:
+        fallback_required_lines = 2
+
+    for y_fallback in range(start_row, height):
+        matching_pixels = reference_background_mask(image[y_fallback])
+        matching_percentage = np.sum(matching_pixels) / width
+
+        if matching_percentage >= 0.98:
+            fallback_consecutive_similar_lines += 1
+            if fallback_consecutive_similar_lines >= fallback_required_lines:
+                if fallback_consecutive_similar_lines >= 10:
+                    fallback_separator_row_y_offset = fallback_consecutive_similar_lines + 5
+                elif fallback_consecutive_similar_lines in (1, 2, 3):
+                    fallback_separator_row_y_offset = 2
+                else:
+                    fallback_separator_row_y_offset = fallback_consecutive_similar_lines + 5
+
+                fallback_separator_row = y_fallback - fallback_separator_row_y_offset
+                break
+        else:
+            fallback_consecutive_similar_lines = 0
+
+    return fallback_separator_row
+
+
+def reference_side_crop_bounds(image):
+    """Column range the old crop_side_whitespace kept, walking in from both edges"""
+    height, width = image.shape[:2]
+
+    left_crop = 0
+    for x in range(width):
+        if np.sum(reference_background_mask(image[:, x])) / height >= 0.98:
+            left_crop = x + 1
+        else:
+            break
+
+    right_crop = width
+    for x in range(width-1, -1, -1):
+        if np.sum(reference_background_mask(image[:, x])) / height >= 0.98:
+            right_crop = x
+        else:
+            break
+
+    expansion = int(round((4 / math.log(3100 / 670)) * math.log(height / 670) + 5))
+    left_expanded = max(0, left_crop - expansion)
+    right_expanded = min(width, right_crop + expansion)
+
+    if left_expanded < right_expanded:
+        return left_expanded, right_expanded
+    return 0, width
+
+
+def reference_find_white_separator(image):
+    """The scan find_white_separator replaced, with the fallback it called then"""
+    height, width = image.shape[:2]
+    start_row = int(height * 0.4)
+
+    first_columns = list(range(1, 5))
+    last_columns = list(range(width-5, width-1))
+    column_heights = reference_uniform_columns(image, first_columns + last_columns, start_row)
+
+    if not column_heights:
+        return -1, False
+
+    min_uniform_top = min(height - col_height for col_height in column_heights.values())
+
+    valid_lines = []
+    for first_col in first_columns:
+        for last_col in last_columns:
+            if first_col in column_heights and last_col in column_heights:
+                if abs(column_heights[first_col] - column_heights[last_col]) > 4:
+                    continue
+
+                scan_row = max(height - column_heights[first_col], height - column_heights[last_col])
+                if start_row <= scan_row < height:
+                    row_pixels = image[scan_row, first_col:last_col+1]
+                    if len(row_pixels) > 0:
+                        line_avg_color = np.mean(row_pixels, axis=0)
+                        color_diffs = np.abs(row_pixels.astype(np.float32) - line_avg_color)
+                        matching_pixels = np.all(color_diffs <= 255 * 0.02, axis=1)
+                        if np.sum(matching_pixels) / len(row_pixels) >= 0.98:
+                            valid_lines.append(scan_row)
+
+    cutoff_row = min(valid_lines) if valid_lines else min_uniform_top
+
+    offset = max(2, round(2 + 3/math.log(3100/670) * math.log(height/670)))
+    separator_row = cutoff_row - offset
+
+    needs_fallback = (separator_row == -1) or (int(height * 0.38) <= cutoff_row <= int(height * 0.42))
+    if needs_fallback:
+        fallback_separator = reference_find_separator_fallback(image, int(height * 0.75))
+        if fallback_separator != -1:
+            return fallback_separator, True
+
+    return separator_row, False
+
+
+def fixture_image(seed):
+    """Synthetic scan: noisy photo above a caption band, with the variations PID scans show"""
+    rng = np.random.default_rng(seed)
+    height, width = int(rng.integers(20, 700)), int(rng.integers(12, 400))
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    separator = int(height * rng.uniform(0.3, 0.9))
+    kind = seed % 6
+
+    if kind in (0, 1, 2):
+        # White, off-white or random caption background with slight noise and a line of text
+        if kind == 0:
+            color = np.array([255, 255, 255])
+        elif kind == 1:
+            color = np.array([251, 249, 250])
+        else:
+            color = rng.integers(0, 256, 3)
+        spread = 6 if kind != 2 else 3
+        noise = rng.integers(-spread, spread + 1, (height - separator, width, 3))
+        image[separator:] = np.clip(color + noise, 0, 255).astype(np.uint8)
+        text_row = separator + (height - separator) // 2
+        image[text_row:text_row + 3, width // 4:width // 2] = 0
+    elif kind == 3:
+        image[:] = 255
+    elif kind == 4:
+        # Thin band near 78% height plus white side margins, which trigger the fallback
+        band = int(height * 0.78)
+        image[band:band + int(rng.integers(1, 30))] = 252
+        image[:, :int(rng.integers(0, width // 3))] = 255
+        image[:, width - int(rng.integers(0, width // 3)):] = [251, 249, 250]
+    else:
+        # Slow vertical gradient, so the running mean drifts
+        base = rng.integers(0, 256, 3)
+        ramp = np.linspace(0, 12, height)[:, None, None]
+        image[:] = np.clip(base + ramp + rng.integers(-2, 3, (height, width, 3)), 0, 255).astype(np.uint8)
+
+    return image
+
+
+@pytest.mark.parametrize('seed', range(36))
+def test_find_white_separator_matches_reference(seed):
+    processor = ImageProcessor(wayback=object())
+    image = fixture_image(seed)
+
+    assert processor.find_white_separator(image) == reference_find_white_separator(bgr(image))
+
+
+def test_find_white_separator_on_caption_band():
+    processor = ImageProcessor(wayback=object())
+    image = np.zeros((1000, 300, 3), dtype=np.uint8)
+    image[:700] = np.random.default_rng(1).integers(0, 200, (700, 300, 3))
+    image[700:] = 255
+
+    separator_row, fallback_used = processor.find_white_separator(image)
+
+    assert not fallback_used
+    assert separator_row == reference_find_white_separator(bgr(image))[0]
+    assert 690 <= separator_row < 700
+
+
+def near_background(rng, shape):
+    """Pixels around white and fbf9fa, on both sides of the match tolerance"""
+    colors = np.array([[255, 255, 255], [251, 249, 250]])
+    pixels = colors[rng.integers(0, 2, shape[:-1])] + rng.integers(-8, 9, shape)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def sprinkle(rng, image, fraction):
+    """Darken a random fraction of pixels, so match fractions land near the 98% threshold"""
+    dark = rng.random(image.shape[:2]) < fraction
+    image[dark] = rng.integers(0, 200, (int(dark.sum()), 3))
+
+
+def margins_image(seed):
+    """Photo between background side margins of random width and cleanliness"""
+    rng = np.random.default_rng(seed)
+    height, width = int(rng.choice([12, 40, 200, 670, 1400])), int(rng.integers(8, 300))
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    left, right = int(rng.integers(0, width // 2 + 1)), int(rng.integers(0, width // 2 + 1))
+    for columns in (slice(0, left), slice(width - right, width)):
+        margin = near_background(rng, image[:, columns].shape) if seed % 3 else np.full_like(image[:, columns], 255)
+        sprinkle(rng, margin, rng.choice([0, 0.01, 0.02, 0.05]))
+        image[:, columns] = margin
+    if seed % 7 == 0:
+        image[:] = 255
+    return image
+
+
+def caption_band_image(seed):
+    """Bottom band with runs of background rows of varying length, as caption strips leave"""
+    rng = np.random.default_rng(seed)
+    height, width = int(rng.choice([20, 120, 670, 1500, 3100, 5200])), int(rng.integers(4, 120))
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    y = int(height * rng.uniform(0.5, 0.8))
+    while y < height:
+        run = int(rng.integers(1, 16))
+        band = near_background(rng, (min(run, height - y), width, 3)) if rng.random() < 0.4 else \
+            np.full((min(run, height - y), width, 3), 255, dtype=np.uint8)
+        sprinkle(rng, band, rng.choice([0, 0, 0.01, 0.03]))
+        image[y:y + run] = band
+        y += run + int(rng.integers(0, 4))
+    return image
+
+
+@pytest.fixture
+def processor():
+    return ImageProcessor(wayback=object())
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_background_mask_matches_reference(processor, seed):
+    rng = np.random.default_rng(seed)
+    image = near_background(rng, (int(rng.integers(1, 60)), int(rng.integers(1, 60)), 3))
+    sprinkle(rng, image, 0.1)
+
+    mask = processor.background_mask(image)
+
+    assert mask.shape == image.shape[:2]
+    assert np.array_equal(mask > 0, reference_background_mask(bgr(image)))
+
+
+def test_background_mask_tolerance_edges(processor):
+    # 5.1 tolerance: 250 still matches white, 249 does not; likewise 246/245 against 251
+    values = np.array([[[250, 250, 250], [249, 255, 255], [246, 254, 245], [246, 254, 246], [255, 244, 255]]],
+                      dtype=np.uint8)
+
+    assert list(processor.background_mask(values)[0] > 0) == list(reference_background_mask(bgr(values))[0])
+
+
+@pytest.mark.parametrize('seed', range(36))
+def test_measure_uniform_columns_matches_reference(processor, seed):
+    image = fixture_image(seed)
+    height, width = image.shape[:2]
+    columns = list(range(1, 5)) + list(range(width-5, width-1))
+    start_row = int(height * (0.4, 0.75, 0.99)[seed % 3])
+
+    expected = reference_uniform_columns(bgr(image), columns, start_row)
+
+    assert processor.measure_uniform_columns(image, columns, start_row) == expected
+
+
+def test_measure_uniform_columns_below_the_scan_window(processor):
+    image = fixture_image(0)[:8]
+
+    assert processor.measure_uniform_columns(image, [1, 2], 3) == reference_uniform_columns(bgr(image), [1, 2], 3) == {}
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_side_crop_bounds_match_reference(processor, seed):
+    image = margins_image(seed)
+    left, right = reference_side_crop_bounds(bgr(image))
+
+    assert processor.side_crop_bounds(image) == (left, right)
+    assert np.array_equal(processor.crop_side_whitespace(image), image[:, left:right])
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_find_separator_fallback_matches_reference(processor, seed):
+    image = caption_band_image(seed)
+    height = image.shape[0]
+
+    for start_row in (int(height * 0.75), int(height * 0.5), height - 1, height):
+        assert processor.find_separator_fallback(image, start_row) == \
+            reference_find_separator_fallback(bgr(image), start_row)
+
+
+def test_find_separator_fallback_long_run_offset(processor):
+    # 5200 rows need a run of 10, which takes the "run + 5" offset
+    image = np.zeros((5200, 40, 3), dtype=np.uint8)
+    image[4500:4600] = 255
+
+    separator_row = processor.find_separator_fallback(image, 3900)
+
+    assert separator_row == reference_find_separator_fallback(bgr(image), 3900) == 4500 + 9 - 15
@@ -0,0 +1,347 @@
+import email.parser
+import email.policy
+import hashlib
+import http.server
+import json
+import threading
+import time
+from urllib.parse import parse_qs
+
+import numpy as np
+import pytest
+import pywikibot
+from pywikibot.login import LoginStatus
+from pywikibot.throttle import Throttle
+
+import main
+
+WRITE_DELAY = 0.1
+
+
+class FakeCommons(http.server.ThreadingHTTPServer):
+    """Local api.php speaking the MediaWiki upload API: direct and chunked stash uploads, plus injected faults"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        self.files = {}       # filename -> bytes
+        self.stash = {}       # filekey -> bytearray
+        self.faults = {}      # filename -> [(status, headers, body)] replied before normal handling
+        self.requests = []    # parameters of every request received
+        self.uploads = []     # (arrival time, filename) of every upload request
+        self.stored = 0
+        self.drop_after_store = False
+        self.hold = 0.0       # seconds each upload request stays in flight
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def base(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def fault(self, filename, body, headers=None, times=1):
+        self.faults.setdefault(filename, []).extend([(200, headers or {}, body)] * times)
+
+    def handle_upload(self, params, files):
+        filename = params['filename']
+        with self.lock:
+            self.requests.append(params)
+            self.uploads.append((time.monotonic(), filename))
+            if self.faults.get(filename):
+                return self.faults[filename].pop(0)
+
+            if 'chunk' in files:
+                filekey = params.get('filekey', f"key{len(self.stash)}")
+                stashed = self.stash.setdefault(filekey, bytearray())
+                assert int(params['offset']) == len(stashed)
+                stashed += files['chunk']
+                done = len(stashed) >= int(params['filesize'])
+                return 200, {}, {'upload': {
+                    'result': 'Success' if done else 'Continue', 'filekey': filekey, 'offset': len(stashed),
+                }}
+
+            content = files['file'] if 'file' in files else bytes(self.stash.pop(params['filekey']))
+            if filename in self.files:
+                if self.files[filename] == content:
+                    return 200, {}, {'error': {
+                        'code': 'fileexists-no-change', 'info': 'The upload is an exact duplicate of the current version',
+                    }}
+                return 200, {}, {'upload': {'result': 'Warning', 'warnings': {'exists': filename}}}
+
+            self.files[filename] = content
+            self.stored += 1
+            if self.drop_after_store:
+                self.drop_after_store = False
+                return None
+            return 200, {}, {'upload': {'result': 'Success', 'filename': filename}}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        content_type = self.headers['Content-Type']
+
+        files = {}
+        if content_type.startswith('multipart/form-data'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename() is not None:
+                    files[name] = part.get_payload(decode=True)
+                else:
+                    params[name] = part.get_payload(decode=True).decode()
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode(), keep_blank_values=True).items()}
+
+        assert params['action'] == 'upload' and params['token'] == FakeSite.tokens['csrf']
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.hold)
+            reply = server.handle_upload(params, files)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+        if reply is None:   # the file was stored but the response is lost
+            self.close_connection = True
+            return
+        status, headers, payload = reply
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSite:
+    """The parts of pywikibot's APISite that api.Request and comms.http use, pointed at the local api.php"""
+
+    code = 'commons'
+    lang = 'commons'
+    tokens = {'csrf': 'token+\\'}
+    userinfo = {'name': 'TestBot', 'id': 1, 'ratelimits': {'upload': {'user': {'hits': 100, 'seconds': 1}}}}
+    _loginstatus = LoginStatus.AS_USER
+    family = type('Family', (), {'name': 'commons'})()
+    siteinfo = type('SiteInfo', (), {'is_cached': staticmethod(lambda key: False)})()
+
+    def __init__(self, base):
+        self.base = base
+        self.throttle = Throttle(self, mindelay=0.01)
+
+    def __str__(self):
+        return 'commons:commons'
+
+    def base_url(self, uri, protocol=None):
+        return self.base + uri
+
+    def apipath(self):
+        return '/w/api.php'
+
+    def scriptpath(self):
+        return '/w'
+
+    def protocol(self):
+        return 'http'
+
+    def encoding(self):
+        return 'utf-8'
+
+    def user(self):
+        return self.userinfo['name']
+
+    def username(self):
+        return self.userinfo['name']
+
+    def is_oauth_token_available(self):
+        return False
+
+    def verify_SSL_certificate(self):
+        return True
+
+
+@pytest.fixture(scope='module')
+def pywikibot_dir(tmp_path_factory):
+    # pywikibot expects throttle.ctrl to persist once this process has taken a pid
+    return str(tmp_path_factory.mktemp('pywikibot'))
+
+
+@pytest.fixture
+def server(pywikibot_dir, monkeypatch):
+    # Keep pywikibot's throttle.ctrl out of the repo and its retries fast
+    monkeypatch.setattr(pywikibot.config, 'base_dir', pywikibot_dir)
+    monkeypatch.setattr(pywikibot.config, 'put_throttle', WRITE_DELAY)
+    monkeypatch.setattr(pywikibot.config, 'max_retries', 2)
+    monkeypatch.setattr(pywikibot.config, 'retry_wait', 0.01)
+    monkeypatch.setattr(pywikibot.config, 'retry_max', 0.05)
+    monkeypatch.setattr(main, 'UPLOAD_REQUEST', None)
+
+    server = FakeCommons()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def site(server):
+    return FakeSite(server.base)
+
+
+@pytest.fixture
+def waits(monkeypatch):
+    waits = []
+    monkeypatch.setattr(main, 'sleep', waits.append)
+    return waits
+
+
+@pytest.fixture
+def file_page(server):
+    class FakeFilePage:
+        def __init__(self, site, title):
+            self.filename = title.split(':', 1)[1]
+
+        def exists(self):
+            return self.filename in server.files
+
+        @property
+        def latest_file_info(self):
+            return type('FileInfo', (), {'sha1': hashlib.sha1(server.files[self.filename]).hexdigest()})
+
+    return FakeFilePage
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+
+def upload(site, file_page, image, filename='Test photo.jpg'):
+    return main.upload_to_commons(site, file_page, image, filename, 'jpg', None, 'description', check_exists=False)
+
+
+def maxlag(seconds):
+    return {'error': {'code': 'maxlag', 'info': f'Waiting for a database server: {seconds} seconds lagged.',
+                      'lag': seconds}}
+
+
+def test_direct_upload(server, site, waits, file_page, image):
+    assert upload(site, file_page, image) == (True, '')
+
+    assert server.files['Test photo.jpg'] == main.encode_upload_image(image, 'jpg', None)
+    request = server.requests[0]
+    assert 'ignorewarnings' not in request
+    assert request['maxlag'] == str(pywikibot.config.maxlag)
+    assert request['assert'] == 'user'
+    assert waits == []
+
+
+def test_ratelimited_is_retried_by_pywikibot(server, site, waits, file_page, image):
+    server.fault('Test photo.jpg', {'error': {'code': 'ratelimited', 'info': 'You have exceeded your rate limit.'}})
+
+    assert upload(site, file_page, image) == (True, '')
+    assert len(server.requests) == 2
+    assert waits == []
+
+
+def test_retry_after_is_honoured_once_pywikibot_gives_up(server, site, waits, file_page, image):
+    limited = {'error': {'code': 'ratelimited', 'info': 'You have exceeded your rate limit.'}}
+    server.fault('Test photo.jpg', limited, {'Retry-After': '30'}, times=pywikibot.config.max_retries + 1)
+
+    assert upload(site, file_page, image) == (True, '')
+    assert len(waits) == 1 and 30 <= waits[0] <= 31
+
+
+def test_maxlag_retry_after_is_honoured_after_pywikibot_gives_up(server, site, waits, file_page, image):
+    # pywikibot retries maxlag at least five times before raising MaxlagTimeoutError
+    server.fault('Test photo.jpg', maxlag(7), {'Retry-After': '7'}, times=6)
+
+    assert upload(site, file_page, image) == (True, '')
+    assert len(waits) == 1 and 7 <= waits[0] <= 8
+
+
+def test_backoff_without_server_hint(server, site, waits, file_page, image):
+    server.fault('Test photo.jpg', {'error': {'code': 'stashfailed', 'info': 'Could not store upload'}}, times=2)
+
+    assert upload(site, file_page, image) == (True, '')
+    first, second = waits
+    assert main.UPLOAD_RETRY_WAIT * 0.8 <= first <= main.UPLOAD_RETRY_WAIT * 1.2
+    assert second > first
+
+
+def test_chunked_upload_through_stash(server, site, waits, file_page, image, monkeypatch):
+    data = main.encode_upload_image(image, 'jpg', None)
+    chunk_size = len(data) // 3 + 1
+    monkeypatch.setattr(main, 'UPLOAD_CHUNK_SIZE', chunk_size)
+
+    assert upload(site, file_page, image) == (True, '')
+
+    chunks = [request for request in server.requests if 'stash' in request]
+    assert [int(request['offset']) for request in chunks] == [0, chunk_size, 2 * chunk_size]
+    assert all(request.get('filekey') == 'key0' for request in chunks[1:])
+    assert server.requests[-1]['filekey'] == 'key0' and 'stash' not in server.requests[-1]
+    assert server.files['Test photo.jpg'] == data
+
+
+def test_chunk_maxlag_restarts_the_stash_upload(server, site, waits, file_page, image, monkeypatch):
+    data = main.encode_upload_image(image, 'jpg', None)
+    monkeypatch.setattr(main, 'UPLOAD_CHUNK_SIZE', len(data) // 2 + 1)
+    server.fault('Test photo.jpg', maxlag(12), {'Retry-After': '12'}, times=6)
+
+    assert upload(site, file_page, image) == (True, '')
+    assert len(waits) == 1 and 12 <= waits[0] <= 13
+    assert server.files['Test photo.jpg'] == data
+
+
+def test_duplicate_of_another_file_is_reported_for_skipping(server, site, waits, file_page, image):
+    server.fault('Test photo.jpg', {'upload': {
+        'result': 'Warning', 'filekey': 'dup.jpg', 'warnings': {'duplicate': ['Same photo.jpg']},
+    }})
+
+    assert upload(site, file_page, image) == (None, 'File:Same photo.jpg')
+    assert 'Test photo.jpg' not in server.files
+    assert len(server.requests) == 1 and waits == []
+
+
+def test_lost_response_is_not_uploaded_twice(server, site, waits, file_page, image):
+    server.drop_after_store = True
+
+    assert upload(site, file_page, image) == (True, '')
+    assert server.stored == 1
+    assert waits == []
+
+
+def test_concurrent_workers_share_the_write_throttle(server, site, waits, file_page, image):
+    workers = main.PIPELINE_WORKERS['upload']
+    names = [f'Photo {n}.jpg' for n in range(2 * workers)]
+    # One upload keeps hitting maxlag while the others succeed without a Retry-After,
+    # which resets the retry_after pywikibot keeps on the shared site throttle
+    server.fault(names[0], maxlag(9), {'Retry-After': '9'}, times=6)
+    server.hold = 2 * WRITE_DELAY
+
+    results = {}
+    pipeline = main.StagePipeline([
+        ('upload', lambda name: results.setdefault(name, upload(site, file_page, image, name)), workers),
+    ])
+    pipeline.run(names)
+
+    assert results == dict.fromkeys(names, (True, ''))
+    assert set(server.files) == set(names)
+    assert len(waits) == 1 and 9 <= waits[0] <= 10
+
+    # Writes from all workers are spaced by the site's put throttle, yet overlap on the wire
+    arrivals = sorted(arrival for arrival, _ in server.uploads)
+    assert min(b - a for a, b in zip(arrivals, arrivals[1:])) >= WRITE_DELAY * 0.5
+    assert 1 < server.max_in_flight <= workers
@@ -0,0 +1,133 @@
+import http.server
+import json
+import threading
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import main
+from main import ImageProcessor, WaybackResolver
+
+TIMESTAMP = '20200101000000'
+
+
+def jpeg_bytes():
+    buffer = BytesIO()
+    Image.fromarray(np.full((40, 60, 3), 128, dtype=np.uint8)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class StandIn(http.server.ThreadingHTTPServer):
+    """Local stand-in for the image host, the CDX API and the snapshot server"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.archived = {}      # original URL -> snapshot bytes
+        self.cdx_status = 200
+        self.cdx_queries = 0
+
+    @property
+    def base(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+
+        if parsed.path == '/cdx':
+            server.cdx_queries += 1
+            if server.cdx_status != 200:
+                return self.reply(server.cdx_status, b'')
+            url = parse_qs(parsed.query)['url'][0]
+            rows = [['timestamp', 'original']]
+            if url in server.archived:
+                rows.append([TIMESTAMP, url])
+            return self.reply(200, json.dumps(rows).encode(), 'application/json')
+
+        prefix = f'/web/{TIMESTAMP}/'
+        if self.path.startswith(prefix) and self.path[len(prefix):] in server.archived:
+            return self.reply(200, server.archived[self.path[len(prefix):]], 'image/jpeg')
+
+        self.reply(404, b'not found')
+
+    def reply(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def processor(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'sleep', lambda seconds: None)
+    resolver = WaybackResolver(
+        str(tmp_path / 'wayback.sqlite3'), cdx_url=f'{server.base}/cdx', snapshot_url=f'{server.base}/web'
+    )
+    return ImageProcessor(wayback=resolver)
+
+
+def test_missing_image_is_fetched_from_snapshot(server, processor):
+    url = f'{server.base}/images/gone.jpg'
+    server.archived[url] = jpeg_bytes()
+
+    image, img_format, _, source, message = processor.download_image(url)
+
+    assert message == "Retrieved from Wayback Machine"
+    assert image.shape == (40, 60, 3)
+    assert img_format == 'jpg'
+    assert source == server.archived[url]
+
+
+def test_snapshot_lookups_are_cached(server, processor):
+    url = f'{server.base}/images/gone.jpg'
+    server.archived[url] = jpeg_bytes()
+
+    processor.download_image(url)
+    processor.download_image(url)
+
+    assert server.cdx_queries == 1
+
+
+def test_missing_snapshot_is_cached_as_negative(server, processor):
+    url = f'{server.base}/images/never-archived.jpg'
+
+    first = processor.download_image(url)
+    second = processor.download_image(url)
+
+    assert first[0] is None and first[4] == "404 error - No archived version found"
+    assert second[4] == "404 error - No archived version found (cached)"
+    assert server.cdx_queries == 1
+
+
+def test_cdx_errors_are_retried_and_not_cached(server, processor):
+    url = f'{server.base}/images/gone.jpg'
+    server.archived[url] = jpeg_bytes()
+    server.cdx_status = 503
+
+    image, _, _, _, message = processor.download_image(url)
+
+    assert image is None
+    assert message.startswith("404 error - Wayback Machine error")
+    assert server.cdx_queries == main.WAYBACK_ATTEMPTS
+
+    server.cdx_status = 200
+    assert processor.download_image(url)[4] == "Retrieved from Wayback Machine"